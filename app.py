@@ -18,11 +18,18 @@ COPY-PASTE READY FOR GITHUB ✅
 """
 
 import streamlit as st
-import tempfile
-import os
-from utils import compile_c_code, run_cppcheck, generate_pdf
-from orchestrator import run_orchestration
-from llm import gemini_explain_compiler_errors
+import time
+import jobqueue
+from config import JOB_WORKERS, JOB_POLL_SECONDS, WEIGHTS, MAX_SCORE
+from utils import generate_pdf_async
+
+# Grading runs in worker processes fed by a SQLite job queue; this page only
+# enqueues and polls. One worker pool per server (0 = run `python jobqueue.py`).
+@st.cache_resource(show_spinner=False)
+def grading_workers():
+    return jobqueue.start_workers(JOB_WORKERS)
+
+grading_workers()
 
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(
@@ -97,7 +104,7 @@ code_text = st.text_area(
 
 submitted = st.button("🚀 Evaluate Code")
 
-# ---------------- MAIN PIPELINE ----------------
+# ---------------- SUBMISSION ----------------
 if submitted:
     if not title.strip():
         st.error("Program title / description is required.")
@@ -107,77 +114,107 @@ if submitted:
         st.error("No C code provided.")
         st.stop()
 
-    with st.status("📂 Preparing Submission...", expanded=True) as status:
-        tmp = tempfile.NamedTemporaryFile(suffix=".c", delete=False)
-        tmp.write(code_text.encode("utf-8"))
-        tmp.flush()
-        tmp.close()
-        source_path = tmp.name
-        st.write(f"✅ Source saved: `{source_path}`")
-        status.update(label="✅ Submission Prepared", state="complete")
-
-    # ---------- COMPILATION ----------
-    with st.status("⚙️ Compiling with gcc...", expanded=True) as status:
-        compile_result = compile_c_code(source_path)
-
-        # ✅ ✅ ✅ -------- CASE 1: COMPILATION FAILS (GEMINI VIA LANGCHAIN) --------
-        if not compile_result["success"]:
-            st.error("❌ Compilation Failed")
+    try:
+        job_id = jobqueue.enqueue(title, code_text)
+    except jobqueue.QueueFull as e:
+        st.error(f"⏳ The grader is at capacity. {e}")
+        st.stop()
 
-            st.subheader("🔴 Raw gcc Error Log")
-            st.code(compile_result["errors"])
+    # The job id lives in the URL, so a refresh keeps following the same grade
+    st.query_params["job"] = job_id
 
-            st.info("🧠 Sending error log to Gemini 2.5 Flash (LangChain) for explanation...")
-            ai_explanation = gemini_explain_compiler_errors(compile_result["errors"])
+# ---------------- MAIN PIPELINE ----------------
+# gcc, cppcheck, Groq test generation and the agents run as one concurrent
+# stage graph in a worker; each stage is logged here as soon as it finishes.
+stage_labels = {
+    "compile": "⚙️ gcc compilation",
+    "static_analysis": "🔍 cppcheck static analysis",
+    "test_cases": "🧪 Groq test generation",
+    "analysis": "📖 Source analysis",
+    "design": "🏗️ Design agent",
+    "optimization": "🚀 Optimization agent",
+    "tests": "🧪 Test agent",
+    "performance": "⚡ Performance agent",
+    "similarity": "🕵️ Similarity check",
+    "compile_explanation": "🧠 Gemini compile error explanation",
+    "report": "📊 Score aggregation",
+}
+
+job_id = st.query_params.get("job")
+if job_id:
+    job = jobqueue.get_job(job_id)
+    if job is None:
+        st.warning("This submission is no longer available. Please evaluate it again.")
+        del st.query_params["job"]
+        st.stop()
 
-            st.subheader("✅ Gemini AI Explanation & Correction Hints")
-            st.write(ai_explanation)
+    if job["status"] in ("queued", "running"):
+        if job["status"] == "queued":
+            label = f"⏳ Waiting for a grader (position {job['position']} in queue)..."
+        else:
+            label = "🤖 Running Grading Pipeline..."
+        with st.status(label, expanded=True):
+            for name in job["stages"]:
+                st.write(f"✅ {stage_labels.get(name, name)} finished")
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
 
-            st.warning("⚠️ You must FIX the errors and RESUBMIT.\n\nThis system will **NOT auto-correct or generate full solutions.**")
+    if job["status"] == "failed":
+        st.error(f"❌ Grading failed: {job['error']}")
+        st.stop()
 
-            os.unlink(source_path)
-            status.update(label="❌ Compilation Failed", state="error")
-            st.stop()
+    result = job["result"]
+    compile_result = result["compile"]
 
-        status.update(label="✅ Compilation Successful", state="complete")
+    # ✅ ✅ ✅ -------- CASE 1: COMPILATION FAILS (GEMINI VIA LANGCHAIN) --------
+    if not compile_result["success"]:
+        st.error("❌ Compilation Failed")
 
-    binary_path = compile_result["binary"]
-    st.success("✅ Compilation Successful — Binary Generated")
+        st.subheader("🔴 Raw gcc Error Log")
+        st.code(compile_result["errors"])
 
-    # ---------- STATIC ANALYSIS ----------
-    with st.status("🔍 Running cppcheck Static Analysis...", expanded=True) as status:
-        static_report = run_cppcheck(source_path)
+        st.subheader("✅ Gemini AI Explanation & Correction Hints")
+        st.write(result["compile_explanation"])
 
-        if static_report.strip():
-            st.subheader("⚠️ cppcheck Warnings")
-            st.code(static_report)
-        else:
-            st.success("✅ No cppcheck warnings detected")
+        st.warning("⚠️ You must FIX the errors and RESUBMIT.\n\nThis system will **NOT auto-correct or generate full solutions.**")
+        st.stop()
 
-        status.update(label="✅ Static Analysis Completed", state="complete")
+    st.success("✅ Compilation Successful — Agentic Evaluation Completed")
 
-    # ---------- MULTI-AGENT ORCHESTRATION ----------
-    with st.status("🤖 Running Multi-Agent Evaluation...", expanded=True) as status:
-        final_report = run_orchestration(
-            title=title,
-            source_c=source_path,
-            binary=binary_path,
-            static_report=static_report
-        )
-        status.update(label="✅ Agentic Evaluation Completed", state="complete")
+    # ---------- STATIC ANALYSIS ----------
+    static_report = result["static_analysis"]["text"]
+    if static_report.strip():
+        st.subheader("⚠️ cppcheck Warnings")
+        st.code(static_report)
+    else:
+        st.success("✅ No cppcheck warnings detected")
+
+    final_report = result["report"]
+
+    # ---------- SIMILARITY ----------
+    matches = result.get("similarity", {}).get("matches")
+    if matches:
+        st.warning(f"🕵️ Near-duplicate of {len(matches)} earlier submission(s) for this problem — review before release")
+        for m in matches:
+            # Web submissions link to their job page; batch ids are the student ids
+            submission = m["submission"]
+            if submission.startswith("job:"):
+                submission = f"[job {submission[4:12]}](?job={submission[4:]})"
+            submitted = time.strftime("%Y-%m-%d %H:%M", time.localtime(m["created"])) if m.get("created") else "unknown time"
+            st.markdown(f"- {submission}, submitted {submitted}: {m['similarity']:.0%} similar")
 
     # ---------- DASHBOARD DISPLAY ----------
     st.header("📊 Evaluation Dashboard")
 
     col1, col2, col3 = st.columns(3)
-    col1.metric("🏗️ Design Score", f"{final_report['design']['score']} / 15")
-    col2.metric("🧪 Test Score", f"{final_report['tests']['score']} / 30")
-    col3.metric("⚡ Performance", f"{final_report['performance']['score']} / 15")
+    col1.metric("🏗️ Design Score", f"{final_report['design']['score']} / {WEIGHTS['design']:g}")
+    col2.metric("🧪 Test Score", f"{final_report['tests']['score']} / {WEIGHTS['tests']:g}")
+    col3.metric("⚡ Performance", f"{final_report['performance']['score']} / {WEIGHTS['performance']:g}")
 
     col4, col5, col6 = st.columns(3)
-    col4.metric("🚀 Optimization", f"{final_report['optimization']['score']} / 20")
-    col5.metric("🛡️ Static", f"{final_report['static_score']} / 20")
-    col6.metric("✅ TOTAL SCORE", f"{final_report['total_score']} / 100")
+    col4.metric("🚀 Optimization", f"{final_report['optimization']['score']} / {WEIGHTS['optimization']:g}")
+    col5.metric("🛡️ Static", f"{final_report['static_score']} / {WEIGHTS['static']:g}")
+    col6.metric("✅ TOTAL SCORE", f"{final_report['total_score']} / {MAX_SCORE:g}")
 
     # ---------- TABBED AGENT REPORTS ----------
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -207,12 +244,38 @@ if submitted:
 
     with tab5:
         st.subheader("Gemini 2.5 Flash — Final Academic Evaluation")
-        st.write(final_report.get("gemini_final_report", "Gemini not configured."))
+        # The worker streams Gemini's text into the job row; show what has arrived so far
+        st.write(job["report_text"] or "✍️ Gemini is writing the report...")
+
+    # ---------- STAGE TIMINGS ----------
+    with st.expander("⏱️ Stage timings"):
+        spans = sorted(final_report.get("spans", []), key=lambda span: -span["seconds"])
+        st.table([
+            {"stage": span["name"], "seconds": span["seconds"], "started at": span.get("start"), "error": span.get("error", "")}
+            for span in spans
+        ])
+
+    if job["status"] == "reporting":
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
 
     # ---------- PDF GENERATION ----------
-    st.info("📄 Generating Final Academic PDF Report...")
-    pdf_path = generate_pdf(final_report)
-
+    # Rendered on the background PDF pool (cached by report hash across reruns);
+    # the page polls the render instead of blocking on it
+    pdf_futures = st.session_state.setdefault("pdf_futures", {})
+    pdf_future = pdf_futures.get(job_id)
+    if pdf_future is None:
+        pdf_future = pdf_futures[job_id] = generate_pdf_async(final_report)
+    if not pdf_future.done():
+        st.info("📄 Generating Final Academic PDF Report...")
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+    del pdf_futures[job_id]
+    try:
+        pdf_path = pdf_future.result()
+    except Exception as e:
+        st.error(f"❌ PDF rendering failed: {e}")
+        st.stop()
     with open(pdf_path, "rb") as f:
         st.download_button(
             "⬇️ Download Final PDF Report",
@@ -220,12 +283,4 @@ if submitted:
             file_name="C_Autograder_Final_Report.pdf"
         )
 
-    # ---------- CLEANUP ----------
-    try:
-        os.unlink(source_path)
-        if os.path.exists(binary_path):
-            os.unlink(binary_path)
-    except Exception:
-        pass
-
     st.success("✅ Evaluation Pipeline Completed Successfully")
@@ -0,0 +1,186 @@
+"""
+batch.py
+Headless cohort grading.
+
+Usage:
+    python batch.py submissions/ --title "Sum of two numbers" -o results.jsonl
+    python batch.py manifest.jsonl -o results.jsonl --workers 8
+    python batch.py submissions/ --title "..." --pdf --merged-pdf cohort.pdf
+    python batch.py submissions/ --title "..." --metrics cohort.npz
+
+A manifest is a JSONL file with one {"path": ..., "title": ..., "id": ...}
+object per line ("id" defaults to the path). Results are appended to the
+output file as each submission finishes; re-running the same command skips
+every id already graded, so a crashed run resumes where it stopped.
+--metrics also writes every submission's raw rubric metrics as a columnar
+.npz file for rescore.py.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from multiprocessing.pool import ThreadPool
+from orchestrator import grade_submission
+from utils import pdf_path_for, generate_pdf_async, generate_pdfs_bulk, run_cppcheck_batch
+from rescore import build_cohort, save_cohort
+
+# ---------------- JOB DISCOVERY ----------------
+def load_jobs(target, title=None):
+    if os.path.isdir(target):
+        if not title:
+            raise SystemExit("--title is required when grading a directory")
+        jobs = []
+        for root, _, files in os.walk(target):
+            for name in sorted(files):
+                if name.endswith(".c"):
+                    path = os.path.join(root, name)
+                    jobs.append({"id": os.path.relpath(path, target), "path": path, "title": title})
+        return sorted(jobs, key=lambda job: job["id"])
+
+    jobs = []
+    with open(target, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            job.setdefault("id", job["path"])
+            job.setdefault("title", title)
+            if not job["title"]:
+                raise SystemExit(f"No title for {job['id']} (set it in the manifest or pass --title)")
+            jobs.append(job)
+    return jobs
+
+def completed_ids(out_path):
+    # Failed submissions are retried on resume; a torn last line is cut by drop_torn_tail
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+def drop_torn_tail(out_path):
+    # Cut a partial last line left by a crash, so the next append starts on a fresh line
+    if not os.path.exists(out_path):
+        return
+    with open(out_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            step = min(64 * 1024, pos)
+            f.seek(pos - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos < end:
+            f.truncate(pos)
+
+# ---------------- WORKER ----------------
+def grade_one(job):
+    # gcc writes the binary next to the source, so work on a private copy
+    workdir = tempfile.mkdtemp(prefix="autograder-batch-")
+    try:
+        source_path = os.path.join(workdir, "main.c")
+        shutil.copyfile(job["path"], source_path)
+
+        # Keyed by job id, so two students handing in the same file are still paired
+        results = grade_submission(job["title"], source_path, submission_id=job["id"])
+        compile_result = results["compile"]
+        record = {
+            "id": job["id"],
+            "path": job["path"],
+            "title": job["title"],
+            "compiled": compile_result["success"],
+        }
+        if compile_result["success"]:
+            record["total_score"] = results["report"]["total_score"]
+            record["report"] = results["report"]
+        else:
+            record["total_score"] = 0
+            record["compile_errors"] = compile_result["errors"].replace(source_path, os.path.basename(job["path"]))
+            record["compile_explanation"] = results["compile_explanation"]
+        return record
+    except Exception as e:
+        return {"id": job["id"], "path": job["path"], "title": job["title"], "error": f"{type(e).__name__}: {e}"}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# ---------------- DRIVER ----------------
+def run_batch(jobs, out_path, workers, threads=False, pdfs=False, cppcheck_jobs=None):
+    drop_torn_tail(out_path)
+    done = completed_ids(out_path)
+    todo = [job for job in jobs if job["id"] not in done]
+    print(f"{len(jobs)} submissions, {len(done)} already graded, {len(todo)} to go", file=sys.stderr)
+
+    if cppcheck_jobs and todo:
+        # One parallel cppcheck pass up front; per-submission runs then hit its cache
+        print(f"Running cppcheck -j{cppcheck_jobs} over {len(todo)} files", file=sys.stderr)
+        run_cppcheck_batch([job["path"] for job in todo], jobs=cppcheck_jobs)
+
+    graded = 0
+    pdf_futures = []
+    # Thread mode keeps every submission in one process so they share the LLM
+    # gateway (rate limits, in-flight de-duplication, report batching); the heavy
+    # work is in gcc/cppcheck/student binaries either way.
+    pool_class = ThreadPool if threads else multiprocessing.Pool
+    with open(out_path, "a", encoding="utf-8") as out, pool_class(workers) as pool:
+        for record in pool.imap_unordered(grade_one, todo):
+            if pdfs and "report" in record:
+                # Path is known from the report hash; rendering happens on the PDF pool
+                record["pdf"] = pdf_path_for(record["report"])
+                pdf_futures.append(generate_pdf_async(record["report"]))
+            out.write(json.dumps(record) + "\n")
+            out.flush()  # every finished submission is a checkpoint
+            graded += 1
+            status = record.get("error") or record["total_score"]
+            print(f"[{graded}/{len(todo)}] {record['id']}: {status}", file=sys.stderr)
+
+    for future in pdf_futures:
+        future.result()
+
+def merge_pdfs(out_path, merged_path):
+    # One cohort PDF from every graded report in the results file
+    reports = []
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "report" in record:
+                reports.append(record["report"])
+    generate_pdfs_bulk(reports, merged_path=merged_path)
+    print(f"Merged {len(reports)} reports into {merged_path}", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grade a whole cohort of C submissions")
+    parser.add_argument("target", help="Directory of .c files or a JSONL manifest")
+    parser.add_argument("--title", help="Problem title (required for a directory)")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL results file (appended, resumable)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", action="store_true", help="Use worker threads in one process (shared LLM gateway)")
+    parser.add_argument("--pdf", action="store_true", help="Render a PDF per submission in the background")
+    parser.add_argument("--merged-pdf", help="Also write one merged PDF of every graded report")
+    parser.add_argument("--cppcheck-jobs", type=int, help="Pre-analyse all files in one cppcheck -j N run")
+    parser.add_argument("--metrics", help="Also write the cohort's raw metrics as .npz (see rescore.py)")
+    args = parser.parse_args()
+
+    run_batch(load_jobs(args.target, args.title), args.output, args.workers, args.threads, args.pdf, args.cppcheck_jobs)
+    if args.merged_pdf:
+        merge_pdfs(args.output, args.merged_pdf)
+    if args.metrics:
+        cohort, _ = build_cohort(args.output)
+        save_cohort(args.metrics, cohort)
+        print(f"Wrote metrics for {len(cohort['id'])} submissions to {args.metrics}", file=sys.stderr)
@@ -0,0 +1,11 @@
+#include <stdio.h>
+
+/* Reads two integers and prints their sum. */
+int main(void) {
+    long a, b;
+    if (scanf("%ld %ld", &a, &b) != 2) {
+        return 1;
+    }
+    printf("%ld\n", a + b);
+    return 0;
+}
@@ -0,0 +1,11 @@
+#include <stdio.h>
+
+int main(void) {
+    int a, b;
+    scanf("%d %d", &a, &b);
+    while (a != b + 1000000007) {
+        a = (a * 31 + 7) % 1000;
+    }
+    printf("%d\n", a + b);
+    return 0;
+}
@@ -0,0 +1,21 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+/* Correct answer, but touches 256 MiB on the way there. */
+int main(void) {
+    size_t size = 256u << 20;
+    char *buffer = malloc(size);
+    long a, b;
+    if (buffer == NULL) {
+        return 1;
+    }
+    memset(buffer, 1, size);
+    if (scanf("%ld %ld", &a, &b) != 2) {
+        free(buffer);
+        return 1;
+    }
+    printf("%ld\n", a + b + buffer[size - 1] - 1);
+    free(buffer);
+    return 0;
+}
@@ -0,0 +1,10 @@
+#include <stdio.h>
+
+int main(void) {
+    int a, b;
+    scanf("%d %d", &a, &b);
+    for (;;) {
+        printf("%d + %d = %d\n", a, b, a + b);
+    }
+    return 0;
+}
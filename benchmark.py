@@ -0,0 +1,258 @@
+"""
+benchmark.py
+Offline benchmark of the full grading path (gcc, cppcheck, every agent,
+the Gemini report and the PDF) over the synthetic corpus in bench/corpus/.
+
+Usage:
+    python benchmark.py
+    python benchmark.py -n 5 -w 4 --llm-latency 0.5 -o bench.json
+    python benchmark.py --baseline bench.json    # exit 1 on a p50 regression
+
+Groq and Gemini are replaced by in-process fake clients with configurable
+latency, so no network access or API keys are needed. Every run uses a fresh
+cache directory and a unique comment in each source, so gcc/cppcheck/PDF
+caches never hide the cost being measured (--warm keeps them).
+"""
+
+import argparse
+import functools
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+from types import SimpleNamespace
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench", "corpus")
+TITLE = "Read two integers and print their sum"
+
+TEST_SUITE = [
+    {"input": "2 3", "expected": "5"},
+    {"input": "-4 4", "expected": "0"},
+    {"input": "100 250", "expected": "350"},
+    {"input": "0 0", "expected": "0"},
+    {"input": "123456 654321", "expected": "777777"},
+]
+
+FAKE_REPORT = (
+    "## Overall Evaluation\n\n"
+    + "The submission was evaluated for design, correctness, performance and code quality. " * 12
+    + "\n\n## Recommendations\n\n"
+    + "- Keep functions short and validate every scanf return value.\n" * 6
+)
+
+FAKE_EXPLANATION = "The compiler reports a missing semicolon and an undeclared identifier. Check the line numbers in the log."
+
+# ---------------- CORPUS ----------------
+def large_source(functions=400):
+    # Correct program padded with many small helpers: stresses source analysis and cppcheck
+    parts = ["#include <stdio.h>\n"]
+    for i in range(functions):
+        parts.append(
+            f"/* helper {i} */\n"
+            f"static int helper_{i}(int x) {{\n"
+            f"    int total = 0;\n"
+            f"    for (int j = 0; j < x % 7; j++) {{\n"
+            f"        if (j % 2 == 0) total += j * {i % 13};\n"
+            f"        else total -= j;\n"
+            f"    }}\n"
+            f"    return total;\n"
+            f"}}\n"
+        )
+    calls = " + ".join(f"helper_{i}(0)" for i in range(0, functions, 50))
+    parts.append(
+        "int main(void) {\n"
+        "    long a, b;\n"
+        "    if (scanf(\"%ld %ld\", &a, &b) != 2) return 1;\n"
+        f"    printf(\"%ld\\n\", a + b + ({calls}));\n"
+        "    return 0;\n"
+        "}\n"
+    )
+    return "".join(parts)
+
+def load_corpus():
+    cases = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith(".c"):
+            with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+                cases[name[:-2]] = f.read()
+    cases["large_source"] = large_source()
+    return cases
+
+# ---------------- FAKE LLM ----------------
+class FakeLLM:
+    # Answers the exact calls llm.py makes on the Groq, Gemini and LangChain clients
+    def __init__(self, latency, jitter):
+        self.latency = latency
+        self.jitter = jitter
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._groq_create))
+
+    def _wait(self):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def _groq_create(self, messages, model):
+        self._wait()
+        content = json.dumps(TEST_SUITE)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self._wait()
+        if not stream:
+            return SimpleNamespace(text=FAKE_REPORT)
+        return self._stream()
+
+    def _stream(self):
+        for i in range(0, len(FAKE_REPORT), 80):
+            yield SimpleNamespace(text=FAKE_REPORT[i:i + 80])
+
+    def invoke(self, prompt):
+        self._wait()
+        return SimpleNamespace(content=FAKE_EXPLANATION)
+
+def install_fake_llm(latency, jitter, unthrottled):
+    import config
+    import llm
+
+    fake = FakeLLM(latency, jitter)
+    # Same hook app.py uses for st.cache_resource: every client name gets the fake
+    llm.use_resource_cache(lambda build: functools.lru_cache(maxsize=None)(lambda name: fake))
+    if unthrottled:
+        # Measure our pipeline, not the provider quota (dicts are shared with llm.py)
+        for provider in config.LLM_REQUESTS_PER_MINUTE:
+            config.LLM_REQUESTS_PER_MINUTE[provider] = 1_000_000
+            config.LLM_CONCURRENCY[provider] = 1_000
+
+# ---------------- RUN ----------------
+def grade_once(case, source, index, pdf, warm):
+    from orchestrator import grade_submission
+    from utils import generate_pdf
+    import tracing
+
+    workdir = tempfile.mkdtemp(prefix="autograder-bench-")
+    try:
+        source_path = os.path.join(workdir, "main.c")
+        with open(source_path, "w", encoding="utf-8") as f:
+            f.write(source if warm else f"/* bench run {index} */\n{source}")
+
+        started = time.perf_counter()
+        with tracing.collect() as spans:
+            results = grade_submission(TITLE, source_path)
+            report = results["report"]
+            if pdf and report is not None:
+                pdf_path = generate_pdf(report)
+                if not warm:
+                    os.unlink(pdf_path)
+        return {
+            "case": case,
+            "seconds": time.perf_counter() - started,
+            "score": report["total_score"] if report else 0,
+            "spans": list(spans),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def percentiles(values):
+    import numpy as np
+    values = np.asarray(values, dtype=float)
+    return {
+        "count": int(values.size),
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+        "max": round(float(values.max()), 4),
+    }
+
+def summarize(runs, wall):
+    stages, cases = {}, {}
+    for run in runs:
+        cases.setdefault(run["case"], []).append(run["seconds"])
+        for span in run["spans"]:
+            stages.setdefault(span["name"], []).append(span["seconds"])
+
+    return {
+        "submissions": len(runs),
+        "wall_seconds": round(wall, 3),
+        "throughput_per_min": round(60 * len(runs) / wall, 2) if wall else None,
+        "latency": percentiles([run["seconds"] for run in runs]),
+        "stages": {name: percentiles(v) for name, v in sorted(stages.items())},
+        "cases": {name: percentiles(v) for name, v in sorted(cases.items())},
+        "scores": {run["case"]: run["score"] for run in runs},
+        # ru_maxrss is in KiB on Linux; children = largest single student/gcc/cppcheck process
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "peak_child_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+def print_summary(summary):
+    print(f"{summary['submissions']} submissions in {summary['wall_seconds']}s "
+          f"({summary['throughput_per_min']} / min)")
+    print(f"latency p50 {summary['latency']['p50']}s  p99 {summary['latency']['p99']}s")
+    print(f"peak RSS: grader {summary['peak_rss_kb'] // 1024} MiB, "
+          f"largest child {summary['peak_child_rss_kb'] // 1024} MiB")
+    for title, table in (("stage", summary["stages"]), ("case", summary["cases"])):
+        print(f"\n{title:<32}{'n':>6}{'p50 s':>10}{'p99 s':>10}{'max s':>10}")
+        for name, p in table.items():
+            print(f"{name:<32}{p['count']:>6}{p['p50']:>10.4f}{p['p99']:>10.4f}{p['max']:>10.4f}")
+
+def compare(summary, baseline, tolerance, floor):
+    # A regression is a p50 that grew by more than `tolerance` and by at least `floor` seconds
+    regressions = []
+    for section in ("stages", "cases"):
+        for name, old in baseline.get(section, {}).items():
+            new = summary[section].get(name)
+            if new and new["p50"] > old["p50"] * (1 + tolerance) and new["p50"] - old["p50"] >= floor:
+                regressions.append(f"{section[:-1]} {name}: p50 {old['p50']}s -> {new['p50']}s")
+    return regressions
+
+def run_benchmark(repeat, workers, pdf, warm, cases=None):
+    corpus = load_corpus()
+    if cases:
+        corpus = {name: corpus[name] for name in cases}
+    jobs = [(case, source, i) for i in range(repeat) for case, source in corpus.items()]
+
+    started = time.perf_counter()
+    with ThreadPool(workers) as pool:
+        runs = pool.starmap(lambda case, source, i: grade_once(case, source, i, pdf, warm), jobs)
+    return summarize(runs, time.perf_counter() - started)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the grading pipeline")
+    parser.add_argument("-n", "--repeat", type=int, default=1, help="Runs of each corpus case")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Submissions graded concurrently")
+    parser.add_argument("--case", action="append", help="Only this corpus case (repeatable)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mean fake LLM latency (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.05, help="Std-dev of the fake latency (s)")
+    parser.add_argument("--throttled", action="store_true", help="Keep the production LLM rate limits")
+    parser.add_argument("--no-pdf", action="store_true", help="Skip PDF rendering")
+    parser.add_argument("--warm", action="store_true", help="Keep caches warm across runs")
+    parser.add_argument("--cache-dir", help="Cache directory (default: a fresh temp dir)")
+    parser.add_argument("-o", "--output", help="Write the summary as JSON")
+    parser.add_argument("--baseline", help="Summary JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative p50 growth")
+    parser.add_argument("--floor", type=float, default=0.01, help="Ignore p50 growth below this (s)")
+    args = parser.parse_args()
+
+    # Before any project import: config reads these at import time
+    os.environ["AUTOGRADER_CACHE_DIR"] = args.cache_dir or tempfile.mkdtemp(prefix="autograder-bench-cache-")
+    os.environ["GROQ_API_KEY"] = os.environ["GEMINI_API_KEY"] = "offline-benchmark"
+    install_fake_llm(args.llm_latency, args.llm_jitter, not args.throttled)
+
+    summary = run_benchmark(args.repeat, args.workers, not args.no_pdf, args.warm, args.case)
+    print_summary(summary)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(summary, json.load(f), args.tolerance, args.floor)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+
+    if not args.cache_dir:
+        shutil.rmtree(os.environ["AUTOGRADER_CACHE_DIR"], ignore_errors=True)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,122 @@
+import codecs
+import math
+import re
+from collections import deque
+from config import CHECKER_MODE, CHECKER_CASE_SENSITIVE, CHECKER_ABS_TOL, CHECKER_REL_TOL, CHECKER_MAX_LINE_BYTES
+
+# Streaming output checker. feed() takes stdout chunks as the child writes
+# them (run_binary's on_stdout hook) and returns True once the output can no
+# longer be accepted, so the runner kills the program there instead of
+# waiting for it to finish or time out. Only "exact" mode can know that early;
+# in "contains" mode any later output could still hold the answer, so it just
+# records whether it was seen. Memory stays bounded by one output line
+# ("exact") or the expected token count / text length ("contains").
+
+_NUMBER_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$")
+MODES = ("exact", "contains")
+PROMPT_ENDINGS = (":", "?", "=", ">")
+
+def _number(token):
+    return float(token) if _NUMBER_RE.match(token) else None
+
+class _Token:
+    def __init__(self, text, case_sensitive):
+        self.text = text if case_sensitive else text.lower()
+        self.value = _number(text)
+        self.tol = CHECKER_ABS_TOL
+        if self.value is not None and "." in text and "e" not in text.lower():
+            # "0.33" accepts 0.333333: half a unit in the last printed digit
+            decimals = len(text.split(".", 1)[1])
+            self.tol = max(self.tol, 0.5 * 10 ** -decimals + 1e-12)
+
+    def matches(self, text, case_sensitive):
+        if self.value is not None:
+            value = _number(text)
+            if value is not None:
+                return abs(value - self.value) <= self.tol or math.isclose(value, self.value, rel_tol=CHECKER_REL_TOL)
+        return self.text == (text if case_sensitive else text.lower())
+
+class StreamChecker:
+    def __init__(self, expected, mode=CHECKER_MODE, case_sensitive=CHECKER_CASE_SENSITIVE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown checker mode: {mode}")
+        self.mode = mode
+        self.case_sensitive = case_sensitive
+        self.expected = [_Token(t, case_sensitive) for t in str(expected).split()]
+        self.pos = 0               # exact: expected tokens matched so far
+        self.window = deque(maxlen=max(len(self.expected), 1))  # contains: last tokens seen
+        self.found = not self.expected
+        # contains: the old plain substring test, run over the stream as well
+        self.text = str(expected).strip() if case_sensitive else str(expected).strip().lower()
+        self.tail = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.partial = b""         # bytes of the unfinished line / token
+        self.failed = False
+
+    # ---------------- FEED ----------------
+    def feed(self, data):
+        if self.failed:
+            return True
+        if self.mode == "contains":
+            self._feed_contains(data)
+            return False
+
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        for line in lines:
+            if not self._consume_line(line):
+                self.failed = True
+                return True
+        # One line longer than any acceptable answer line is already wrong
+        if len(self.partial) > max(CHECKER_MAX_LINE_BYTES, 4 * sum(len(t.text) + 1 for t in self.expected)):
+            self.failed = True
+        return self.failed
+
+    def finish(self):
+        # Call once at EOF; True if the whole output was accepted
+        if self.mode == "contains":
+            self._feed_contains(b"\n")
+            return self.found
+        if not self.failed and self.partial:
+            self.failed = not self._consume_line(self.partial)
+            self.partial = b""
+        return not self.failed and self.pos == len(self.expected)
+
+    # ---------------- EXACT ----------------
+    def _matches_at(self, tokens):
+        if self.pos + len(tokens) > len(self.expected):
+            return False
+        return all(self.expected[self.pos + i].matches(t, self.case_sensitive) for i, t in enumerate(tokens))
+
+    def _consume_line(self, line):
+        tokens = line.decode(errors="replace").split()
+        if not self._matches_at(tokens):
+            # Retry without a leading prompt ("Enter two numbers:", "Sum =")
+            cut = max((i for i, t in enumerate(tokens) if t.endswith(PROMPT_ENDINGS)), default=-1)
+            tokens = tokens[cut + 1:]
+            if cut < 0 or not self._matches_at(tokens):
+                return False
+        self.pos += len(tokens)
+        return True
+
+    # ---------------- CONTAINS ----------------
+    def _feed_contains(self, data):
+        if self.found:
+            return
+        chunk = self.decoder.decode(data)
+        window = self.tail + (chunk if self.case_sensitive else chunk.lower())
+        if self.text and self.text in window:
+            self.found = True
+            return
+        self.tail = window[-len(self.text):] if self.text else ""
+
+        data = self.partial + data
+        # A trailing token may continue in the next chunk
+        cut = max(data.rfind(b" "), data.rfind(b"\n"), data.rfind(b"\t"), data.rfind(b"\r")) + 1
+        self.partial = data[cut:] if len(data) - cut <= CHECKER_MAX_LINE_BYTES else b""
+        for token in data[:cut].decode(errors="replace").split():
+            self.window.append(token)
+            if len(self.window) == len(self.expected) and all(
+                    e.matches(t, self.case_sensitive) for e, t in zip(self.expected, self.window)):
+                self.found = True
+                return
@@ -0,0 +1,132 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from config import CACHE_DIR, COMPILE_CACHE_MAX_BYTES
+
+# Content-addressed gcc artifact cache. Each entry is a directory named by
+# sha256(gcc version, flags, source) holding the binary (successful builds)
+# and meta.json with the gcc log. Entries are built in a private temp dir and
+# published with an atomic rename, so concurrent workers never see half-written
+# entries; the directory mtime is the LRU clock.
+
+COMPILE_CACHE_DIR = os.path.join(CACHE_DIR, "compile")
+SOURCE_PLACEHOLDER = "<source.c>"
+
+@functools.lru_cache(maxsize=None)
+def gcc_version():
+    try:
+        proc = subprocess.run(["gcc", "--version"], capture_output=True, text=True)
+        return proc.stdout.splitlines()[0] if proc.stdout else "gcc-unknown"
+    except FileNotFoundError:
+        return "gcc-missing"
+
+def cache_key(source_bytes, flags):
+    h = hashlib.sha256()
+    h.update(gcc_version().encode())
+    h.update(b"\0")
+    h.update(" ".join(flags).encode())
+    h.update(b"\0")
+    h.update(source_bytes)
+    return h.hexdigest()
+
+@contextmanager
+def _cache_lock():
+    os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(COMPILE_CACHE_DIR, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _materialize(cached_binary, bin_path):
+    # Hard link is O(1); the caller may unlink bin_path without touching the cache
+    if os.path.exists(bin_path):
+        os.unlink(bin_path)
+    try:
+        os.link(cached_binary, bin_path)
+    except OSError:
+        shutil.copy2(cached_binary, bin_path)
+
+def lookup(key, src, bin_path):
+    entry = os.path.join(COMPILE_CACHE_DIR, key)
+    try:
+        with open(os.path.join(entry, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["success"]:
+            _materialize(os.path.join(entry, "binary"), bin_path)
+        os.utime(entry)
+    except (OSError, ValueError, KeyError):
+        # Missing, or evicted by another worker while we were reading it
+        return None
+
+    return {
+        "success": meta["success"],
+        "errors": meta["errors"].replace(SOURCE_PLACEHOLDER, src),
+        "binary": bin_path,
+        "cached": True
+    }
+
+def store(key, src, result):
+    try:
+        os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=COMPILE_CACHE_DIR)
+    except OSError:
+        return
+
+    try:
+        if result["success"]:
+            shutil.copy2(result["binary"], os.path.join(tmp, "binary"))
+        # Temp source paths differ per submission, so store the log path-free
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({
+                "success": result["success"],
+                "errors": result["errors"].replace(src, SOURCE_PLACEHOLDER)
+            }, f)
+        os.rename(tmp, os.path.join(COMPILE_CACHE_DIR, key))
+    except OSError:
+        # Another worker published the same key first (or the disk is full)
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+
+    evict()
+
+def _entry_size(entry):
+    total = 0
+    for name in os.listdir(entry):
+        try:
+            total += os.path.getsize(os.path.join(entry, name))
+        except OSError:
+            pass
+    return total
+
+def evict(max_bytes=COMPILE_CACHE_MAX_BYTES):
+    with _cache_lock():
+        entries = []
+        for name in os.listdir(COMPILE_CACHE_DIR):
+            path = os.path.join(COMPILE_CACHE_DIR, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), _entry_size(path), path))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            # Rename first so readers see "missing" rather than a half-deleted entry
+            trash = tempfile.mkdtemp(prefix=".trash-", dir=COMPILE_CACHE_DIR)
+            try:
+                os.rename(path, os.path.join(trash, "entry"))
+            except OSError:
+                pass
+            shutil.rmtree(trash, ignore_errors=True)
+            total -= size
@@ -0,0 +1,177 @@
+import argparse
+import math
+import random
+import time
+import numpy as np
+from config import (
+    COMPLEXITY_START_SIZE, COMPLEXITY_MAX_SIZE, COMPLEXITY_BUDGET_SECONDS,
+    COMPLEXITY_TARGET_SECONDS, COMPLEXITY_MIN_SECONDS, COMPLEXITY_MAX_INPUT_BYTES, GENERATOR_DB
+)
+from kvstore import KVStore
+from runner import run_binary, discard_spills
+from test_store import normalize_title
+from tracing import traced
+from utils import build_program
+
+# Empirical complexity probe: run the compiled binary on inputs of doubling
+# size n and fit CPU time against n. The series stops as soon as one run is
+# slow enough to be measured well, times out, or the overall budget (input
+# generation included) is spent.
+
+# ---------------- INPUT GENERATORS ----------------
+# Instructors register a C program per problem title that reads n on stdin
+# and prints one input of size n; without one the default below is used.
+_store = KVStore(GENERATOR_DB)
+
+def register_input_generator(title, source):
+    _store.put(normalize_title(title), source, pinned=True)
+
+def drop_input_generator(title):
+    _store.delete(normalize_title(title))
+
+def get_input_generator(title):
+    return _store.get(normalize_title(title))
+
+def default_input_generator(n):
+    # "n" followed by n integers: fits both "read n" and "read n then an array"
+    rng = random.Random(n)
+    values = " ".join(str(rng.randint(-1000, 1000)) for _ in range(n))
+    return f"{n}\n{values}\n".encode()
+
+def _program_generator(binary):
+    def generate(n):
+        run = run_binary(binary, f"{n}\n".encode(), output_cap=COMPLEXITY_MAX_INPUT_BYTES)
+        discard_spills(run)
+        if run["timed_out"] or run["limit"] or run["returncode"] != 0 or run["truncated"]:
+            raise ValueError(f"input generator failed at n={n}")
+        return run["stdout"]
+    return generate
+
+def input_generator_for(title):
+    source = get_input_generator(title) if title else None
+    if source is None:
+        return default_input_generator
+    try:
+        return _program_generator(build_program(source))
+    except ValueError:
+        return default_input_generator  # does not build on this host
+
+# ---------------- CURVE FITTING ----------------
+MODELS = [
+    ("O(1)", lambda n: np.zeros_like(n)),
+    ("O(log n)", lambda n: np.log2(n)),
+    ("O(n)", lambda n: n),
+    ("O(n log n)", lambda n: n * np.log2(n)),
+    ("O(n²)", lambda n: n ** 2),
+    ("O(n³)", lambda n: n ** 3),
+]
+
+def classify(sizes, times):
+    n = np.asarray(sizes, dtype=float)
+    t = np.asarray(times, dtype=float)
+
+    # Power-law fit in log-log space doubles as the exponential check: a
+    # polynomial gives a straight line there, an exponential keeps bending up
+    logn, logt = np.log(n), np.log(np.maximum(t, 1e-6))
+    slope = float(np.polyfit(logn, logt, 1)[0])
+    if len(n) >= 3:
+        power_resid = float(np.sum((np.polyval(np.polyfit(logn, logt, 1), logn) - logt) ** 2))
+        exp_resid = float(np.sum((np.polyval(np.polyfit(n, logt, 1), n) - logt) ** 2))
+        if slope > 3.5 and exp_resid < 0.5 * power_resid:
+            return "O(2ⁿ)", slope
+
+    # t ≈ a + c·f(n) with c ≥ 0, fitted on relative error (the intercept soaks
+    # up process start-up). The smallest residual wins and a simpler model wins
+    # ties within 10%, so timer noise does not inflate the class.
+    w = 1.0 / np.maximum(t, COMPLEXITY_MIN_SECONDS)
+    best = None
+    for name, f in MODELS:
+        basis = np.column_stack([np.ones_like(n), f(n)])
+        coef, *_ = np.linalg.lstsq(basis * w[:, None], t * w, rcond=None)
+        if coef[1] < 0:
+            coef = np.array([np.average(t, weights=w ** 2), 0.0])
+        resid = float(np.sum(((basis @ coef - t) * w) ** 2))
+        if best is None or resid < best[1] * 0.9:
+            best = (name, resid)
+
+    return best[0], slope
+
+# ---------------- PROBE ----------------
+@traced
+def probe_complexity(binary_path, title=None, budget=COMPLEXITY_BUDGET_SECONDS):
+    generate = input_generator_for(title)
+    sizes, times = [], []
+    spent = 0.0
+    stop = "max size reached"
+    blowup = False
+
+    n = COMPLEXITY_START_SIZE
+    while n <= COMPLEXITY_MAX_SIZE:
+        remaining = budget - spent
+        if remaining <= 0:
+            stop = "time budget exhausted"
+            break
+
+        started = time.monotonic()
+        try:
+            input_data = generate(n)
+        except ValueError as e:
+            stop = str(e)
+            break
+        run = run_binary(binary_path, input_data, timeout=max(remaining - (time.monotonic() - started), 0.01))
+        discard_spills(run)
+        spent += time.monotonic() - started
+        if run["limit"] in ("wall_time", "cpu_time", "memory", "output"):
+            stop = f"stopped at n={n} ({run['limit'].replace('_', ' ')} limit)"
+            # One doubling blew through the rest of the budget: growth steeper than n^5
+            if run["timed_out"] and times and run["wall_time"] / max(times[-1], COMPLEXITY_MIN_SECONDS) >= 32:
+                blowup = True
+            break
+
+        sizes.append(n)
+        times.append(run["cpu_time"])
+        if run["cpu_time"] >= COMPLEXITY_TARGET_SECONDS:
+            stop = f"reached {COMPLEXITY_TARGET_SECONDS}s at n={n}"
+            break
+        n *= 2
+
+    result = {"sizes": sizes, "times": [round(t, 5) for t in times], "stop": stop, "class": None, "slope": None}
+
+    if blowup:
+        result["class"] = "O(2ⁿ)"
+        result["note"] = "runtime exploded between the last two sizes"
+    elif len(sizes) >= 2 and max(times) < COMPLEXITY_MIN_SECONDS:
+        # Too fast to resolve with rusage granularity at every size we could afford
+        result["class"] = "O(1)"
+        result["note"] = f"below {COMPLEXITY_MIN_SECONDS * 1000:.0f} ms up to n={sizes[-1]}"
+    elif len(sizes) >= 4:
+        result["class"], slope = classify(sizes, times)
+        result["slope"] = None if math.isnan(slope) else round(slope, 2)
+
+    return result
+
+# ---------------- CLI ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage complexity-probe input generators")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add-generator", help="Register a C input generator (reads n on stdin) for a problem title")
+    add.add_argument("title")
+    add.add_argument("source_c")
+
+    show = sub.add_parser("show-generator", help="Print the input generator for a title")
+    show.add_argument("title")
+
+    drop = sub.add_parser("drop-generator", help="Remove the input generator for a title")
+    drop.add_argument("title")
+
+    args = parser.parse_args()
+    if args.command == "add-generator":
+        with open(args.source_c, encoding="utf-8") as f:
+            source = f.read()
+        build_program(source)  # refuse a generator that does not compile
+        register_input_generator(args.title, source)
+    elif args.command == "show-generator":
+        print(get_input_generator(args.title))
+    elif args.command == "drop-generator":
+        drop_input_generator(args.title)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 WEIGHTS = {
     "design": 15.0,
@@ -7,9 +8,183 @@ WEIGHTS = {
     "optimization": 20.0,
     "static": 20.0
 }
+MAX_SCORE = sum(WEIGHTS.values())
 
 TEST_TIMEOUT_SECONDS = 2
 
+# Test cases of one submission run concurrently on this many workers (1 = serial)
+TEST_PARALLELISM = 5
+
+# Captured stdout/stderr per run is capped; past the cap the program is killed
+# ("kill") or the rest is spilled to a temp file ("spill"). UI/PDF only ever
+# get DISPLAY_OUTPUT_CHARS of it.
+OUTPUT_CAP_BYTES = 1024 * 1024
+OUTPUT_OVERFLOW = "kill"
+DISPLAY_OUTPUT_CHARS = 200
+
+# Output checking as the program writes (checker.py). "contains" (default): the
+# expected tokens appear as a run anywhere in the output, or the expected text is
+# a plain substring of it, so prompts and prose around the answer are fine; it
+# never stops a run early. "exact": the whitespace-separated tokens must equal
+# the expected ones (a leading prompt such as "Enter n:" or "Sum =" on a line is
+# skipped) and the run is killed at the first definite mismatch.
+# Numbers match within CHECKER_ABS_TOL / CHECKER_REL_TOL or half a unit in the
+# last digit the expected value prints. A test case may set "check" to override.
+CHECKER_MODE = "contains"
+CHECKER_CASE_SENSITIVE = False
+CHECKER_ABS_TOL = 1e-6
+CHECKER_REL_TOL = 1e-9
+CHECKER_MAX_LINE_BYTES = 64 * 1024
+
+# Sandbox for student binaries: rlimits applied in the child before exec. CPU
+# time is capped at the run's wall timeout (rounded up); RLIMIT_NPROC counts every
+# process of the grader's user, so leave headroom for the grader itself (and note
+# root ignores it). Each run gets its own process group and scratch directory.
+SANDBOX_MEMORY_BYTES = 512 * 1024 * 1024
+SANDBOX_MAX_PROCESSES = 256
+SANDBOX_MAX_FILE_BYTES = 16 * 1024 * 1024
+
+# Fork-server mode: binaries are linked with forkserver_shim.c and each test /
+# performance run forks from a pre-started copy instead of a fresh exec
+FORKSERVER = os.getenv("AUTOGRADER_FORKSERVER", "0") == "1"
+FORKSERVER_POOL_SIZE = TEST_PARALLELISM
+
+# Heap profiling: each test input is run once more with memprof_shim.c preloaded
+# (LD_PRELOAD) to count allocations and blocks still live at exit. Blocks libc
+# itself leaves allocated (stdio buffers) are measured once and subtracted.
+# Opt-in (AUTOGRADER_MEMPROF=1); without it the unfreed-malloc heuristic is scored.
+MEMPROF = os.getenv("AUTOGRADER_MEMPROF", "0") == "1"
+
+# performance_agent: untimed warm-up runs, then timed repeats per test input (median CPU time is scored)
+PERF_WARMUP_RUNS = 1
+PERF_REPEAT_RUNS = 5
+
+# Complexity probe: run the binary on inputs of doubling size n and fit CPU time vs n.
+# The series stops once a run takes COMPLEXITY_TARGET_SECONDS or the budget is spent.
+COMPLEXITY_PROBE = True
+COMPLEXITY_START_SIZE = 16
+COMPLEXITY_MAX_SIZE = 1 << 18
+COMPLEXITY_BUDGET_SECONDS = 3.0
+COMPLEXITY_TARGET_SECONDS = 0.25
+COMPLEXITY_MIN_SECONDS = 0.005
+# Largest stdin an instructor's input generator may print
+COMPLEXITY_MAX_INPUT_BYTES = 16 * 1024 * 1024
+
+# Max stages of one submission (gcc, cppcheck, LLM calls, agents) running at once
+PIPELINE_WORKERS = 8
+
+# On-disk caches shared by every worker on this host
+CACHE_DIR = os.getenv("AUTOGRADER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "c_autograder_cache"))
+
+# Compiled binaries / gcc error logs, keyed by source + gcc version + flags (LRU by size)
+COMPILE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Instructor programs (build_program): one binary per distinct source
+PROGRAM_DIR = os.path.join(CACHE_DIR, "programs")
+# Complexity-probe input generators per problem title (python complexity.py add-generator)
+GENERATOR_DB = os.path.join(CACHE_DIR, "input_generators.sqlite3")
+
+# cppcheck: parsed findings + --cppcheck-build-dir per distinct source (LRU by count); -j for batch runs
+CPPCHECK_CACHE_DIR = os.path.join(CACHE_DIR, "cppcheck")
+CPPCHECK_CACHE_MAX_ENTRIES = 5000
+CPPCHECK_BATCH_BUILD_DIR = os.path.join(CPPCHECK_CACHE_DIR, "batch-build")
+CPPCHECK_JOBS = os.cpu_count() or 1
+
+# Static score = 20 minus these per-finding penalties
+STATIC_SEVERITY_PENALTY = {
+    "error": 4.0,
+    "warning": 2.0,
+    "performance": 1.0,
+    "portability": 1.0,
+    "style": 0.5,
+    "information": 0.0
+}
+
+# Scoring rubric (rubric.py). Each category starts at its WEIGHTS value and loses
+# these points; agents store the raw metrics, so `python rescore.py` can apply a
+# changed rubric to a whole cohort without running anything again.
+RUBRIC = {
+    "design": {
+        "max_lines": 200, "long_penalty": 2,
+        "min_functions": 2, "few_functions_penalty": 3,
+        "min_comments": 3, "few_comments_penalty": 2,
+    },
+    "performance": {
+        "slow_seconds": 0.7, "slow_penalty": 3,
+        "very_slow_seconds": 1.2, "very_slow_penalty": 3,
+        # Measured growth class; the loop count only counts when the probe had no answer
+        "complexity_penalty": {"O(n²)": 2, "O(n³)": 4, "O(2ⁿ)": 4},
+        "max_loops": 5, "loops_penalty": 2,
+        "max_branches": 12, "branches_penalty": 2,
+    },
+    "optimization": {
+        "leak_penalty": 4,                # blocks still live at exit (heap profile)
+        "churn_allocs": 10_000, "churn_penalty": 2,
+        "unfreed_malloc_penalty": 4,      # malloc without free in the source, when not profiled
+        "output_in_loop_penalty": 3,
+    },
+    "static": {
+        "severity_penalty": STATIC_SEVERITY_PENALTY,
+        "other_penalty": 1.0,
+    },
+}
+
+# Rendered PDF reports, named by report hash; rendering runs on a background process pool
+PDF_CACHE_DIR = os.path.join(CACHE_DIR, "pdf")
+PDF_CACHE_MAX_FILES = 5000
+PDF_WORKERS = 2
+
+# Groq-generated test suites, reused across submissions with the same problem title.
+# Instructor-pinned suites never expire or get evicted.
+TEST_SUITE_DB = os.path.join(CACHE_DIR, "test_suites.sqlite3")
+TEST_SUITE_TTL_SECONDS = 7 * 24 * 3600
+TEST_SUITE_MAX_ENTRIES = 2000
+
+# Gemini explanations of gcc errors, keyed by a normalized error signature (paths,
+# line numbers and student identifiers removed), so a lab full of the same
+# "expected ';'" mistakes costs one LLM call. Least recently used entries go first.
+EXPLANATION_DB = os.path.join(CACHE_DIR, "compile_explanations.sqlite3")
+EXPLANATION_TTL_SECONDS = 30 * 24 * 3600
+EXPLANATION_MAX_ENTRIES = 5000
+EXPLANATION_MAX_DIAGNOSTICS = 8
+
+# Instructor reference solutions (reference.py), one per problem title. When one
+# is registered its output on each test input replaces the suite's "expected";
+# outputs are memoized per (solution, input), evicting the least recently used.
+REFERENCE_DB = os.path.join(CACHE_DIR, "references.sqlite3")
+REFERENCE_MAX_OUTPUTS = 20000
+
+# Web submissions go through a SQLite job queue drained by worker processes.
+# New submissions are refused while JOB_QUEUE_MAX_PENDING are queued or running;
+# a running job whose worker stops heart-beating is requeued (at most JOB_MAX_ATTEMPTS runs).
+JOB_QUEUE_DB = os.path.join(CACHE_DIR, "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("AUTOGRADER_JOB_WORKERS", "2"))
+JOB_QUEUE_MAX_PENDING = 200
+JOB_POLL_SECONDS = 1.0
+JOB_HEARTBEAT_SECONDS = 5.0
+JOB_STALE_SECONDS = 120.0
+JOB_MAX_ATTEMPTS = 2
+JOB_RETENTION_SECONDS = 24 * 3600
+
+# Per-stage latency: spans are attached to each report, and every process
+# aggregates them into histograms flushed to METRICS_DIR (Prometheus text format
+# in METRICS_FILE, or served by `python tracing.py --serve PORT`)
+METRICS_DIR = os.path.join(CACHE_DIR, "metrics")
+METRICS_FILE = os.path.join(METRICS_DIR, "autograder.prom")
+METRICS_FLUSH_SECONDS = 10.0
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Near-duplicate detection: MinHash signatures of abstracted token shingles in a
+# persistent LSH index, scoped per problem title. Pairs whose estimated Jaccard
+# similarity reaches the threshold are listed in the report (not scored).
+# Submissions with fewer shingles than the minimum are too small to judge.
+SIMILARITY_DB = os.path.join(CACHE_DIR, "similarity.sqlite3")
+SIMILARITY_SHINGLE_SIZE = 5
+SIMILARITY_PERMUTATIONS = 128
+SIMILARITY_BANDS = 32
+SIMILARITY_THRESHOLD = 0.8
+SIMILARITY_MIN_SHINGLES = 40
+SIMILARITY_MAX_MATCHES = 5
+
 # ✅ LLM API KEYS (SET AS ENV VARIABLES)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
@@ -17,3 +192,23 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GROQ_MODEL = "llama-3.1-8b-instant"
 GEMINI_MODEL = "gemini-2.5-flash"
 
+# LLM SDKs are imported lazily; a first import slower than this is logged
+LLM_IMPORT_BUDGET_SECONDS = 1.5
+
+# LLM gateway: per-call timeout, retries with exponential backoff on 429/5xx/timeouts,
+# and per-provider concurrency + request-rate limits (token bucket)
+LLM_TIMEOUT_SECONDS = 60
+LLM_MAX_RETRIES = 4
+LLM_BACKOFF_SECONDS = 1.0
+LLM_CONCURRENCY = {"groq": 4, "gemini": 4}
+LLM_REQUESTS_PER_MINUTE = {"groq": 30, "gemini": 60}
+
+# Final-report prompt is a compact digest of the grade, never the raw report
+REPORT_PROMPT_MAX_CHARS = 4000
+REPORT_PROMPT_MAX_FAILED_CASES = 3
+REPORT_PROMPT_MAX_STATIC_LINES = 10
+
+# Batch grading: final-report prompts arriving within the window are sent as one
+# Gemini request (1 = every report is its own request)
+LLM_REPORT_BATCH_SIZE = 1
+LLM_REPORT_BATCH_WINDOW_SECONDS = 0.5
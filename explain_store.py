@@ -0,0 +1,93 @@
+import argparse
+import hashlib
+import re
+from config import EXPLANATION_DB, EXPLANATION_TTL_SECONDS, EXPLANATION_MAX_ENTRIES, EXPLANATION_MAX_DIAGNOSTICS
+from kvstore import KVStore
+from llm import gemini_explain_compiler_errors, EXPLANATION_FALLBACKS
+from source_analysis import KEPT_IDENTIFIERS
+from tracing import traced
+
+# Compiler-error explanations keyed by what went wrong rather than by whose
+# code it was. The gcc log is reduced to a signature: only error lines, without
+# file paths, line/column numbers, source excerpts or student identifiers
+# (keywords and library names stay), de-duplicated and sorted. Gemini explains
+# the signature itself, so a cached answer never mentions another student's
+# names or line numbers; the student still sees their own gcc log next to it.
+
+_store = KVStore(EXPLANATION_DB, ttl=EXPLANATION_TTL_SECONDS, max_entries=EXPLANATION_MAX_ENTRIES)
+
+_ERROR_RE = re.compile(r"\b(fatal error|error): (.+)$")
+_UNDEFINED_RE = re.compile(r"undefined reference to [`‘']([^`'’]+)['’]")
+_QUOTED_RE = re.compile(r"[‘'`]([^‘’'`]*)[’']")
+_WORD_RE = re.compile(r"\b[A-Za-z_]\w*\b")
+_NUMBER_RE = re.compile(r"\b\d+\b")
+
+# ---------------- SIGNATURE ----------------
+def _abstract(text):
+    return _WORD_RE.sub(lambda m: m.group(0) if m.group(0) in KEPT_IDENTIFIERS else "ID", text)
+
+def _normalize(message):
+    # Identifiers only ever appear quoted in gcc messages; unquoted words are gcc's own
+    message = _QUOTED_RE.sub(lambda m: "'" + _abstract(m.group(1)) + "'", message)
+    return _NUMBER_RE.sub("N", message.strip())
+
+def error_signature(error_log):
+    lines = set()
+    for line in error_log.splitlines():
+        undefined = _UNDEFINED_RE.search(line)
+        if undefined:
+            lines.add(f"linker error: undefined reference to '{_abstract(undefined.group(1))}'")
+            continue
+        match = _ERROR_RE.search(line)
+        if match:
+            lines.add(f"{match.group(1)}: {_normalize(match.group(2))}")
+    return "\n".join(sorted(lines)[:EXPLANATION_MAX_DIAGNOSTICS])
+
+def signature_key(signature):
+    return hashlib.sha256(signature.encode()).hexdigest()
+
+# ---------------- CACHE ----------------
+@traced
+def explain_compiler_errors(error_log):
+    # Cached explanation for this kind of failure; only novel signatures reach Gemini
+    signature = error_signature(error_log)
+    if not signature:
+        return gemini_explain_compiler_errors(error_log)  # nothing recognisable to share
+
+    key = signature_key(signature)
+    cached = _store.get(key)
+    if cached is not None:
+        return cached
+
+    explanation = gemini_explain_compiler_errors(signature)
+    if explanation not in EXPLANATION_FALLBACKS:
+        _store.put(key, explanation)
+    return explanation
+
+# ---------------- CLI ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage cached compiler-error explanations")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    show = sub.add_parser("show", help="Print the signature of a gcc log and its cached explanation")
+    show.add_argument("log_file")
+
+    pin = sub.add_parser("pin", help="Pin an instructor explanation for the signature of a gcc log")
+    pin.add_argument("log_file")
+    pin.add_argument("text_file")
+
+    drop = sub.add_parser("drop", help="Forget the explanation for the signature of a gcc log")
+    drop.add_argument("log_file")
+
+    args = parser.parse_args()
+    with open(args.log_file, encoding="utf-8") as f:
+        signature = error_signature(f.read())
+    if args.command == "show":
+        print(signature or "(no recognisable errors)")
+        print("---")
+        print(_store.get(signature_key(signature)))
+    elif args.command == "pin":
+        with open(args.text_file, encoding="utf-8") as f:
+            _store.put(signature_key(signature), f.read(), pinned=True)
+    elif args.command == "drop":
+        _store.delete(signature_key(signature))
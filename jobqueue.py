@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from config import (
+    JOB_QUEUE_DB, JOB_WORKERS, JOB_QUEUE_MAX_PENDING, JOB_POLL_SECONDS, JOB_HEARTBEAT_SECONDS,
+    JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETENTION_SECONDS
+)
+from orchestrator import grade_submission, stream_final_report
+from test_store import normalize_title
+import tracing
+
+# Durable job queue between the Streamlit front end and the grading workers.
+# app.py only enqueues and polls; worker processes claim jobs one at a time
+# and run the full pipeline, so a browser refresh never loses a grade and the
+# number of concurrent gcc/cppcheck/binary runs is bounded by the worker count.
+#
+# Job states: queued -> running -> reporting (scores stored, Gemini text
+# streaming into report_text) -> done | failed.
+
+ACTIVE_STATES = ("queued", "running", "reporting")
+
+class QueueFull(Exception):
+    pass
+
+_ready = set()
+
+def _connect(path=JOB_QUEUE_DB):
+    if path not in _ready:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Autocommit; claim() takes its own write lock with BEGIN IMMEDIATE
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    if path not in _ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                dedupe_key TEXT NOT NULL,
+                title TEXT NOT NULL,
+                source TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                stages TEXT NOT NULL DEFAULT '[]',
+                report_text TEXT NOT NULL DEFAULT '',
+                error TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                heartbeat REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status)")
+        _ready.add(path)
+    return conn
+
+def dedupe_key(title, source):
+    return hashlib.sha256(f"{normalize_title(title)}\0{source}".encode()).hexdigest()
+
+# ---------------- FRONT END SIDE ----------------
+def enqueue(title, source, path=JOB_QUEUE_DB):
+    # Returns the job id; an identical submission already in flight is reused
+    key = dedupe_key(title, source)
+    now = time.time()
+    conn = _connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            f"SELECT id FROM jobs WHERE dedupe_key = ? AND status IN {ACTIVE_STATES} ORDER BY created LIMIT 1",
+            (key,)
+        ).fetchone()
+        if row:
+            conn.execute("COMMIT")
+            return row[0]
+
+        pending = conn.execute(f"SELECT COUNT(*) FROM jobs WHERE status IN {ACTIVE_STATES}").fetchone()[0]
+        if pending >= JOB_QUEUE_MAX_PENDING:
+            conn.execute("ROLLBACK")
+            raise QueueFull(f"{pending} submissions are already waiting; please retry shortly.")
+
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO jobs (id, dedupe_key, title, source, status, created) VALUES (?, ?, ?, ?, 'queued', ?)",
+            (job_id, key, title, source, now)
+        )
+        conn.execute("COMMIT")
+        return job_id
+    finally:
+        conn.close()
+
+def get_job(job_id, path=JOB_QUEUE_DB):
+    conn = _connect(path)
+    try:
+        row = conn.execute(
+            "SELECT status, stages, result, report_text, error, created, started, finished FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, stages, result, report_text, error, created, started, finished = row
+        job = {
+            "id": job_id,
+            "status": status,
+            "stages": json.loads(stages),
+            "result": json.loads(result) if result else None,
+            "report_text": report_text,
+            "error": error,
+            "created": created,
+            "started": started,
+            "finished": finished,
+        }
+        if status == "queued":
+            job["position"] = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (created,)
+            ).fetchone()[0] + 1
+        return job
+    finally:
+        conn.close()
+
+# ---------------- WORKER SIDE ----------------
+def claim(path=JOB_QUEUE_DB):
+    # Atomically move the oldest queued job to running; stale running jobs
+    # (worker died mid-grade) are requeued or failed first
+    now = time.time()
+    conn = _connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', finished = ? "
+            "WHERE status IN ('running', 'reporting') AND heartbeat < ? AND attempts >= ?",
+            (now, now - JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'queued' WHERE status IN ('running', 'reporting') AND heartbeat < ?",
+            (now - JOB_STALE_SECONDS,)
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+            (now - JOB_RETENTION_SECONDS,)
+        )
+        row = conn.execute(
+            "SELECT id, title, source FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started = ?, heartbeat = ?, "
+                "stages = '[]', result = NULL, report_text = '' WHERE id = ?",
+                (now, now, row[0])
+            )
+        conn.execute("COMMIT")
+        return {"id": row[0], "title": row[1], "source": row[2]} if row else None
+    finally:
+        conn.close()
+
+def _update(job_id, path, **fields):
+    conn = _connect(path)
+    try:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+def _heartbeat(job_id, path, stop):
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        _update(job_id, path, heartbeat=time.time())
+
+def _stored_result(results):
+    # What the UI needs; the binary and per-stage internals stay in the worker
+    compile_result = results["compile"]
+    return {
+        "compile": {"success": compile_result["success"], "errors": compile_result["errors"]},
+        "compile_explanation": results["compile_explanation"],
+        "static_analysis": results["static_analysis"],
+        "similarity": results["similarity"],
+        "report": results["report"],
+    }
+
+def _grade_job(job, path, workdir):
+    source_path = os.path.join(workdir, "main.c")
+    with open(source_path, "w", encoding="utf-8") as f:
+        f.write(job["source"])
+
+    # Finished stage names feed the live log in the UI
+    finished_stages = []
+    def log_stage(name, result):
+        finished_stages.append(name)
+        _update(job["id"], path, stages=json.dumps(finished_stages))
+
+    # "job:<id>" in the similarity index, so a match leads back to this job
+    results = grade_submission(job["title"], source_path, on_stage_done=log_stage, stream_report=True,
+                               submission_id=f"job:{job['id']}")
+    stored = _stored_result(results)
+    stored["compile"]["errors"] = stored["compile"]["errors"].replace(source_path, "main.c")
+    report = results["report"]
+    if report is None:
+        _update(job["id"], path, status="done", result=json.dumps(stored), finished=time.time())
+        return
+
+    # Scores are visible while Gemini writes the narrative into report_text
+    _update(job["id"], path, status="reporting", result=json.dumps(stored))
+    text, flushed = "", 0.0
+    for chunk in stream_final_report(report):
+        text += chunk
+        if time.monotonic() - flushed >= JOB_POLL_SECONDS / 2:
+            _update(job["id"], path, report_text=text)
+            flushed = time.monotonic()
+    _update(job["id"], path, status="done", result=json.dumps(stored),
+            report_text=report["gemini_final_report"], finished=time.time())
+
+def run_job(job, path=JOB_QUEUE_DB):
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job["id"], path, stop), daemon=True).start()
+    workdir = tempfile.mkdtemp(prefix="autograder-job-")
+    try:
+        # One trace for the whole job, so the streamed Gemini report's span joins report["spans"]
+        with tracing.collect():
+            _grade_job(job, path, workdir)
+    except Exception as e:
+        _update(job["id"], path, status="failed", error=f"{type(e).__name__}: {e}", finished=time.time())
+    finally:
+        stop.set()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def worker_loop(path=JOB_QUEUE_DB, once=False):
+    while True:
+        job = claim(path)
+        if job:
+            run_job(job, path)
+        elif once:
+            return
+        else:
+            time.sleep(JOB_POLL_SECONDS)
+
+def start_workers(count=JOB_WORKERS, path=JOB_QUEUE_DB):
+    # Spawned (not forked) so workers never inherit Streamlit's threads or state
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    for i in range(count):
+        proc = ctx.Process(target=worker_loop, args=(path,), name=f"grader-{i}", daemon=True)
+        proc.start()
+        workers.append(proc)
+    return workers
+
+# ---------------- CLI ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run grading workers for the web job queue")
+    parser.add_argument("-w", "--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+
+    for proc in start_workers(args.workers):
+        proc.join()
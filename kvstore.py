@@ -0,0 +1,76 @@
+import json
+import os
+import sqlite3
+import time
+
+# Small SQLite-backed JSON store shared by the grading caches. Safe across
+# threads and worker processes (one connection per call, WAL journal).
+# Entries expire after `ttl` seconds and the least recently used unpinned
+# rows are evicted beyond `max_entries`; pinned rows are never dropped.
+
+class KVStore:
+    def __init__(self, path, ttl=None, max_entries=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    pinned INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (pinned, accessed)")
+            self._ready = True
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created, pinned FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created, pinned = row
+            if not pinned and self.ttl is not None and now - created > self.ttl:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def put(self, key, value, pinned=False):
+        now = time.time()
+        with self._connect() as conn:
+            if not pinned:
+                # Never let a regenerated value replace an instructor-pinned one
+                row = conn.execute("SELECT pinned FROM entries WHERE key = ?", (key,)).fetchone()
+                if row and row[0]:
+                    return
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created, accessed, pinned) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value), now, now, int(pinned))
+            )
+            if self.max_entries is not None:
+                conn.execute("""
+                    DELETE FROM entries WHERE pinned = 0 AND key IN (
+                        SELECT key FROM entries WHERE pinned = 0
+                        ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
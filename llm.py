@@ -1,33 +1,82 @@
-from groq import Groq
-import google.generativeai as genai
-from config import GROQ_API_KEY, GEMINI_API_KEY, GROQ_MODEL, GEMINI_MODEL
-
-# ✅ FIXED for LangChain 1.x
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
-
-groq_client = None
-gemini_model = None
-gemini_langchain = None
-
-# -------- GROQ CLIENT --------
-if GROQ_API_KEY:
-    groq_client = Groq(api_key=GROQ_API_KEY)
-
-# -------- GEMINI DIRECT --------
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel(GEMINI_MODEL)
-
-# -------- GEMINI via LANGCHAIN --------
-if GEMINI_API_KEY:
-    gemini_langchain = ChatGoogleGenerativeAI(
-        model=GEMINI_MODEL,
-        google_api_key=GEMINI_API_KEY,
-        temperature=0.3
-    )
+import asyncio
+import functools
+import importlib
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from config import (
+    GROQ_API_KEY, GEMINI_API_KEY, GROQ_MODEL, GEMINI_MODEL, LLM_IMPORT_BUDGET_SECONDS,
+    LLM_TIMEOUT_SECONDS, LLM_MAX_RETRIES, LLM_BACKOFF_SECONDS, LLM_CONCURRENCY,
+    LLM_REQUESTS_PER_MINUTE, LLM_REPORT_BATCH_SIZE, LLM_REPORT_BATCH_WINDOW_SECONDS
+)
+from tracing import traced
 
-def groq_generate_tests(prompt):
+# SDK imports and client construction are deferred to first use: importing
+# this module is free, and a process that never calls Gemini (e.g. a worker
+# whose submissions all compile) never loads google.generativeai or LangChain.
+
+log = logging.getLogger(__name__)
+
+# Seconds spent importing each SDK in this process, for cold-start tracking
+import_timings = {}
+
+def _timed_import(name):
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    if name not in import_timings:
+        import_timings[name] = elapsed
+        if elapsed > LLM_IMPORT_BUDGET_SECONDS:
+            log.warning("Importing %s took %.2fs (budget %.2fs)", name, elapsed, LLM_IMPORT_BUDGET_SECONDS)
+    return module
+
+# -------- CLIENT BUILDERS --------
+def _build_client(name):
+    # -------- GROQ CLIENT --------
+    if name == "groq":
+        if not GROQ_API_KEY:
+            return None
+        return _timed_import("groq").Groq(api_key=GROQ_API_KEY, timeout=LLM_TIMEOUT_SECONDS)
+
+    # -------- GEMINI DIRECT --------
+    if name == "gemini":
+        if not GEMINI_API_KEY:
+            return None
+        genai = _timed_import("google.generativeai")
+        genai.configure(api_key=GEMINI_API_KEY)
+        return genai.GenerativeModel(GEMINI_MODEL)
+
+    # -------- GEMINI via LANGCHAIN --------
+    if name == "gemini_langchain":
+        if not GEMINI_API_KEY:
+            return None
+        # ✅ FIXED for LangChain 1.x
+        ChatGoogleGenerativeAI = _timed_import("langchain_google_genai").ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=GEMINI_MODEL,
+            google_api_key=GEMINI_API_KEY,
+            temperature=0.3,
+            timeout=LLM_TIMEOUT_SECONDS
+        )
+
+    raise ValueError(f"Unknown LLM client: {name}")
+
+# One client per process. The long-lived job-queue and batch workers keep it in
+# this module-level cache; use_resource_cache() swaps in another cache (the
+# benchmark's fake clients). The Streamlit page itself makes no LLM calls.
+get_client = functools.lru_cache(maxsize=None)(_build_client)
+
+def use_resource_cache(cache_decorator):
+    global get_client
+    get_client = cache_decorator(_build_client)
+
+# ---------------- PROVIDER CALLS (blocking SDK calls, run on gateway threads) ----------------
+def _groq_chat(prompt):
+    groq_client = get_client("groq")
     if not groq_client:
         return None
     chat = groq_client.chat.completions.create(
@@ -36,15 +85,232 @@ def groq_generate_tests(prompt):
     )
     return chat.choices[0].message.content
 
-def gemini_generate_report(prompt):
+def _gemini_generate(prompt):
+    gemini_model = get_client("gemini")
     if not gemini_model:
         return None
-    response = gemini_model.generate_content(prompt)
+    response = gemini_model.generate_content(prompt, request_options={"timeout": LLM_TIMEOUT_SECONDS})
     return response.text
 
-def gemini_explain_compiler_errors(error_log):
+def _gemini_stream(prompt):
+    gemini_model = get_client("gemini")
+    if not gemini_model:
+        return
+    for chunk in gemini_model.generate_content(prompt, stream=True):
+        if chunk.text:
+            yield chunk.text
+
+def _gemini_langchain_invoke(prompt):
+    gemini_langchain = get_client("gemini_langchain")
     if not gemini_langchain:
-        return "Gemini API not configured."
+        return None
+    # A plain string is sent as one HumanMessage; no langchain_core import needed
+    response = gemini_langchain.invoke(prompt)
+    return response.content
+
+# ---------------- ASYNC GATEWAY ----------------
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = ("RateLimit", "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "Timeout", "Connection")
+
+def _is_retryable(exc):
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if status in RETRYABLE_STATUS:
+        return True
+    return any(name in type(exc).__name__ for name in RETRYABLE_NAMES)
+
+class TokenBucket:
+    # Smooths request starts to the provider quota; only touched from the gateway loop
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+REPORT_MARKER = "=== REPORT {} ==="
+_REPORT_MARKER_RE = re.compile(r"^=== REPORT (\d+) ===\s*$", re.M)
+
+def _split_reports(text, count):
+    # Answers by marker number, in request order; None unless 1..count each appear exactly once
+    parts = _REPORT_MARKER_RE.split(text)[1:]
+    numbers = [int(n) for n in parts[0::2]]
+    if sorted(numbers) != list(range(1, count + 1)):
+        return None
+    answers = dict(zip(numbers, parts[1::2]))
+    return [answers[i].strip() for i in range(1, count + 1)]
+
+class LLMGateway:
+    # One event loop thread per process. Every provider call goes through a
+    # per-provider semaphore and token bucket, gets a timeout and exponential
+    # backoff on 429/5xx/timeouts, and identical in-flight prompts share a
+    # single request. With LLM_REPORT_BATCH_SIZE > 1, final-report prompts that
+    # arrive within LLM_REPORT_BATCH_WINDOW_SECONDS go out as one request.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            # A forked worker inherits the object but not the loop thread
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._semaphores = {p: asyncio.Semaphore(n) for p, n in LLM_CONCURRENCY.items()}
+                self._buckets = {p: TokenBucket(LLM_REQUESTS_PER_MINUTE[p], LLM_CONCURRENCY[p]) for p in LLM_CONCURRENCY}
+                self._inflight = {}
+                self._report_queue = []
+                self._report_timer = None
+                threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True).start()
+            return self._loop
+
+    def run(self, coro):
+        # Blocking entry point for the synchronous pipeline threads
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    async def call(self, provider, fn, prompt):
+        key = (fn.__name__, prompt)
+        if key not in self._inflight:
+            task = asyncio.ensure_future(self._call_with_retries(provider, fn, prompt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(self._inflight[key])
+
+    async def _call_with_retries(self, provider, fn, prompt):
+        semaphore = self._semaphores[provider]
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self._buckets[provider].acquire()
+            await semaphore.acquire()
+            # A thread cannot be cancelled: a timed-out call keeps its slot until
+            # the SDK returns, so retries never exceed LLM_CONCURRENCY in flight
+            worker = asyncio.ensure_future(asyncio.to_thread(fn, prompt))
+            worker.add_done_callback(lambda task: (semaphore.release(), task.cancelled() or task.exception()))
+            try:
+                return await asyncio.wait_for(asyncio.shield(worker), LLM_TIMEOUT_SECONDS)
+            except Exception as e:
+                if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                    log.warning("%s call failed after %d attempt(s): %s", provider, attempt + 1, e)
+                    return None
+                error = e
+            delay = LLM_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+            log.info("%s call retrying in %.1fs: %s", provider, delay, error)
+            await asyncio.sleep(delay)
+
+    # -------- STREAMING --------
+    def stream(self, provider, fn, prompt):
+        # Sync iterator over chunks of a streaming call. Same limits as call();
+        # an attempt is only retried if it failed before its first chunk.
+        chunks = queue.Queue()
+        done = object()
+
+        def drain(emitted):
+            for chunk in fn(prompt):
+                emitted.append(True)
+                chunks.put(chunk)
+
+        async def produce():
+            try:
+                for attempt in range(LLM_MAX_RETRIES + 1):
+                    emitted = []
+                    await self._buckets[provider].acquire()
+                    async with self._semaphores[provider]:
+                        try:
+                            await asyncio.to_thread(drain, emitted)
+                            return
+                        except Exception as e:
+                            if emitted or attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                                log.warning("%s stream failed after %d attempt(s): %s", provider, attempt + 1, e)
+                                return
+                    await asyncio.sleep(LLM_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random()))
+            finally:
+                chunks.put(done)
+
+        asyncio.run_coroutine_threadsafe(produce(), self._ensure_loop())
+        while True:
+            try:
+                chunk = chunks.get(timeout=LLM_TIMEOUT_SECONDS)
+            except queue.Empty:
+                log.warning("%s stream stalled for %ss", provider, LLM_TIMEOUT_SECONDS)
+                return
+            if chunk is done:
+                return
+            yield chunk
+
+    # -------- REPORT COALESCING --------
+    async def report(self, prompt):
+        if LLM_REPORT_BATCH_SIZE <= 1:
+            return await self.call("gemini", _gemini_generate, prompt)
+
+        future = asyncio.get_running_loop().create_future()
+        self._report_queue.append((prompt, future))
+        if len(self._report_queue) >= LLM_REPORT_BATCH_SIZE:
+            self._flush_reports()
+        elif self._report_timer is None:
+            self._report_timer = asyncio.get_running_loop().call_later(
+                LLM_REPORT_BATCH_WINDOW_SECONDS, self._flush_reports)
+        return await future
+
+    def _flush_reports(self):
+        if self._report_timer is not None:
+            self._report_timer.cancel()
+            self._report_timer = None
+        batch = self._report_queue[:LLM_REPORT_BATCH_SIZE]
+        del self._report_queue[:LLM_REPORT_BATCH_SIZE]
+        if batch:
+            asyncio.ensure_future(self._send_report_batch(batch))
+        if self._report_queue:
+            self._report_timer = asyncio.get_running_loop().call_later(
+                LLM_REPORT_BATCH_WINDOW_SECONDS, self._flush_reports)
+
+    async def _send_report_batch(self, batch):
+        texts = None
+        if len(batch) > 1:
+            combined = (
+                f"Below are {len(batch)} independent requests. Answer each one separately, "
+                f"starting each answer with its marker line exactly as given (e.g. {REPORT_MARKER.format(1)}).\n\n"
+                + "\n\n".join(f"{REPORT_MARKER.format(i + 1)}\n{prompt}" for i, (prompt, _) in enumerate(batch))
+            )
+            text = await self.call("gemini", _gemini_generate, combined)
+            if text:
+                texts = _split_reports(text, len(batch))
+
+        if texts is None:
+            # Single prompt, or the model did not keep the markers: send individually
+            texts = await asyncio.gather(*(self.call("gemini", _gemini_generate, prompt) for prompt, _ in batch))
+
+        for (_, future), text in zip(batch, texts):
+            if not future.done():
+                future.set_result(text)
+
+gateway = LLMGateway()
+
+# ---------------- PUBLIC API ----------------
+async def groq_generate_tests_async(prompt):
+    return await gateway.call("groq", _groq_chat, prompt)
+
+async def gemini_generate_report_async(prompt):
+    return await gateway.report(prompt)
+
+# Returned instead of an explanation; never worth caching
+EXPLANATION_NOT_CONFIGURED = "Gemini API not configured."
+EXPLANATION_UNAVAILABLE = "Gemini explanation is temporarily unavailable. Please retry."
+EXPLANATION_FALLBACKS = (EXPLANATION_NOT_CONFIGURED, EXPLANATION_UNAVAILABLE)
+
+async def gemini_explain_compiler_errors_async(error_log):
+    if not GEMINI_API_KEY:
+        return EXPLANATION_NOT_CONFIGURED
 
     prompt = f"""
 You are a C programming instructor.
@@ -53,10 +319,29 @@ Rules:
 - Do NOT rewrite the student's code.
 - Do NOT generate a full solution.
 - ONLY explain the errors and give hints.
+- The log may be normalized: ID stands for a student's identifier and N for a number.
 
 GCC Error Log:
 {error_log}
 """
 
-    response = gemini_langchain.invoke([HumanMessage(content=prompt)])
-    return response.content
+    response = await gateway.call("gemini", _gemini_langchain_invoke, prompt)
+    return response if response else EXPLANATION_UNAVAILABLE
+
+# Timed from the caller's thread: the span includes queueing behind the gateway limits
+@traced
+def groq_generate_tests(prompt):
+    return gateway.run(groq_generate_tests_async(prompt))
+
+@traced
+def gemini_generate_report(prompt):
+    return gateway.run(gemini_generate_report_async(prompt))
+
+@traced
+def gemini_stream_report(prompt):
+    # Yields the report text as Gemini produces it (nothing if not configured)
+    yield from gateway.stream("gemini", _gemini_stream, prompt)
+
+@traced
+def gemini_explain_compiler_errors(error_log):
+    return gateway.run(gemini_explain_compiler_errors_async(error_log))
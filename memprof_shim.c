@@ -0,0 +1,126 @@
+/*
+ * memprof_shim.c
+ * LD_PRELOAD allocation counter for student binaries (see memprof.py).
+ *
+ * malloc, calloc, realloc, free and the aligned allocators are forwarded to
+ * glibc's __libc_* entry points (no dlsym, so nothing allocates while the
+ * shim resolves itself) and counted with atomics. At exit a destructor writes
+ * one line to the file named by AUTOGRADER_MEMPROF_OUT:
+ *
+ *     allocs frees bytes_allocated peak_bytes live_blocks live_bytes
+ *
+ * Sizes are malloc_usable_size() values, so a block counts the same on the
+ * way in and out. A program killed by a signal or leaving through _exit()
+ * writes nothing.
+ */
+
+#include <errno.h>
+#include <fcntl.h>
+#include <malloc.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+
+extern void *__libc_malloc(size_t size);
+extern void *__libc_calloc(size_t nmemb, size_t size);
+extern void *__libc_realloc(void *ptr, size_t size);
+extern void *__libc_memalign(size_t alignment, size_t size);
+extern void __libc_free(void *ptr);
+
+static uint64_t mp_allocs, mp_frees, mp_bytes, mp_peak, mp_live_blocks, mp_live_bytes;
+
+static void mp_alloc(void *ptr, size_t requested) {
+    uint64_t live, peak;
+
+    if (ptr == NULL)
+        return;
+    __atomic_add_fetch(&mp_allocs, 1, __ATOMIC_RELAXED);
+    __atomic_add_fetch(&mp_bytes, requested, __ATOMIC_RELAXED);
+    __atomic_add_fetch(&mp_live_blocks, 1, __ATOMIC_RELAXED);
+    live = __atomic_add_fetch(&mp_live_bytes, malloc_usable_size(ptr), __ATOMIC_RELAXED);
+    peak = __atomic_load_n(&mp_peak, __ATOMIC_RELAXED);
+    while (live > peak && !__atomic_compare_exchange_n(&mp_peak, &peak, live, 1, __ATOMIC_RELAXED, __ATOMIC_RELAXED))
+        ;
+}
+
+static void mp_release(void *ptr) {
+    if (ptr == NULL)
+        return;
+    __atomic_add_fetch(&mp_frees, 1, __ATOMIC_RELAXED);
+    __atomic_sub_fetch(&mp_live_blocks, 1, __ATOMIC_RELAXED);
+    __atomic_sub_fetch(&mp_live_bytes, malloc_usable_size(ptr), __ATOMIC_RELAXED);
+}
+
+void *malloc(size_t size) {
+    void *ptr = __libc_malloc(size);
+    mp_alloc(ptr, size);
+    return ptr;
+}
+
+void *calloc(size_t nmemb, size_t size) {
+    void *ptr = __libc_calloc(nmemb, size);
+    mp_alloc(ptr, nmemb * size);
+    return ptr;
+}
+
+void *realloc(void *ptr, size_t size) {
+    size_t old = ptr ? malloc_usable_size(ptr) : 0;
+    void *out = __libc_realloc(ptr, size);
+
+    if (ptr != NULL && (out != NULL || size == 0)) {
+        /* the old block is gone: count it as freed and the result as new */
+        __atomic_add_fetch(&mp_frees, 1, __ATOMIC_RELAXED);
+        __atomic_sub_fetch(&mp_live_blocks, 1, __ATOMIC_RELAXED);
+        __atomic_sub_fetch(&mp_live_bytes, old, __ATOMIC_RELAXED);
+    }
+    mp_alloc(out, size);
+    return out;
+}
+
+void free(void *ptr) {
+    mp_release(ptr);
+    __libc_free(ptr);
+}
+
+void *memalign(size_t alignment, size_t size) {
+    void *ptr = __libc_memalign(alignment, size);
+    mp_alloc(ptr, size);
+    return ptr;
+}
+
+void *aligned_alloc(size_t alignment, size_t size) {
+    return memalign(alignment, size);
+}
+
+int posix_memalign(void **out, size_t alignment, size_t size) {
+    void *ptr;
+
+    if (alignment % sizeof(void *) != 0 || (alignment & (alignment - 1)) != 0)
+        return EINVAL;
+    ptr = memalign(alignment, size);
+    if (ptr == NULL)
+        return ENOMEM;
+    *out = ptr;
+    return 0;
+}
+
+__attribute__((destructor)) static void autograder_memprof_report(void) {
+    const char *path = getenv("AUTOGRADER_MEMPROF_OUT");
+    char line[160];
+    int fd, len;
+
+    if (path == NULL)
+        return;
+    fd = open(path, O_WRONLY | O_CREAT | O_TRUNC, 0600);
+    if (fd < 0)
+        return;
+    len = snprintf(line, sizeof line, "%llu %llu %llu %llu %llu %llu\n",
+                   (unsigned long long)mp_allocs, (unsigned long long)mp_frees,
+                   (unsigned long long)mp_bytes, (unsigned long long)mp_peak,
+                   (unsigned long long)mp_live_blocks, (unsigned long long)mp_live_bytes);
+    if (len > 0)
+        (void)!write(fd, line, (size_t)len);
+    close(fd);
+}
@@ -1,25 +1,104 @@
-from agents import design_agent, test_agent, performance_agent, optimization_agent
-from config import WEIGHTS
-from llm import gemini_generate_report
-
-def run_orchestration(title, source_c, binary, static_report):
-    design = design_agent(source_c)
-    tests = test_agent(title, source_c, binary)
-    performance = performance_agent(source_c, binary)
-    optimization = optimization_agent(source_c)
-
-    # Improved Static Analysis Scoring
-    # Count occurrences of actual issues, not just lines
-    # Cppcheck standard format usually includes ": (error)" or ": (warning)"
-    # Fallback to counting lines that have '):' which indicates a file position
-    issue_count = static_report.count("error:") + static_report.count("warning:")
-    if issue_count == 0 and "Checking" in static_report:
-         # Fallback if standard keywords aren't found but report is not empty
-         # Filter out "Checking..." lines
-         lines = [line for line in static_report.splitlines() if "Checking " not in line and line.strip() != ""]
-         issue_count = len(lines)
-
-    static_score = max(0, 20 - issue_count * 2.0)
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import tracing
+from agents import design_agent, generate_test_cases, test_agent, performance_agent, optimization_agent
+from config import (
+    WEIGHTS, MAX_SCORE, PIPELINE_WORKERS, REPORT_PROMPT_MAX_CHARS, REPORT_PROMPT_MAX_FAILED_CASES,
+    REPORT_PROMPT_MAX_STATIC_LINES
+)
+from llm import gemini_generate_report, gemini_stream_report
+from explain_store import explain_compiler_errors
+from utils import compile_c_code, run_cppcheck
+from source_analysis import analyze_source
+from similarity import check_similarity
+from rubric import score_category, static_metrics
+
+GEMINI_REPORT_FALLBACK = "Gemini API not configured or unavailable."
+
+# ---------------- STAGE SCHEDULER ----------------
+def run_stage_graph(stages, initial=None, on_stage_done=None, max_workers=PIPELINE_WORKERS):
+    # stages: {name: (deps, fn)}. Each fn gets the results finished so far and
+    # is started as soon as all of its deps are done, so wall-clock time follows
+    # the critical path instead of the sum of every stage.
+    results = dict(initial or {})
+    pending = {name: stage for name, stage in stages.items() if name not in results}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name, (deps, fn) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    # Stages inherit the caller's context, and with it the submission's trace
+                    running[pool.submit(contextvars.copy_context().run, fn, dict(results))] = name
+                    del pending[name]
+
+            if not running:
+                raise ValueError(f"Unresolvable stage dependencies: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                # Called from the scheduling thread, so UI code (Streamlit) is safe here
+                if on_stage_done:
+                    on_stage_done(name, results[name])
+
+    return results
+
+# ---------------- SCORING ----------------
+def score_static(findings):
+    # Severity-weighted penalties over cppcheck's structured findings
+    return score_category("static", static_metrics(findings))
+
+def _clip(text, limit):
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+def build_report_prompt(raw_report):
+    # Scores plus a compact, size-bounded digest of each agent's findings:
+    # the full cppcheck text and every test case stay out of the prompt.
+    tests = raw_report["tests"]
+    failed = [c for c in tests["cases"] if not c["pass"]][:REPORT_PROMPT_MAX_FAILED_CASES]
+    static_lines = [line for line in raw_report["static_report"].splitlines() if line.strip()]
+    severities = {}
+    for f in raw_report["static_findings"]:
+        severities[f["severity"]] = severities.get(f["severity"], 0) + 1
+
+    lines = [
+        f"Total score: {raw_report['total_score']} / {MAX_SCORE:g}",
+        f"Design ({raw_report['design']['score']}/{WEIGHTS['design']:g}): {_clip(raw_report['design']['report'], 300)}",
+        f"Functional tests ({tests['score']}/{WEIGHTS['tests']:g}): {tests['report']}",
+    ]
+    for c in failed:
+        lines.append(f"  - failed: input={_clip(c['input'], 60)!r} expected={_clip(c['expected'], 60)!r} actual={_clip(c['actual'], 60)!r}")
+    lines += [
+        f"Performance ({raw_report['performance']['score']}/{WEIGHTS['performance']:g}): {_clip(raw_report['performance']['report'], 400)}",
+        f"Optimization ({raw_report['optimization']['score']}/{WEIGHTS['optimization']:g}): {_clip(raw_report['optimization']['report'], 400)}",
+        f"Static analysis ({raw_report['static_score']}/{WEIGHTS['static']:g}): "
+        + (", ".join(f"{n} {sev}" for sev, n in sorted(severities.items())) or "no cppcheck findings"),
+    ]
+    for line in static_lines[:REPORT_PROMPT_MAX_STATIC_LINES]:
+        lines.append(f"  - {_clip(line, 160)}")
+
+    data = "\n".join(lines)[:REPORT_PROMPT_MAX_CHARS]
+
+    # ✅ FINAL REPORT BY GEMINI 2.5 FLASH
+    return f"""
+Generate a professional university-grade evaluation report using this data.
+No JSON. Human readable format.
+
+DATA:
+{data}
+"""
+
+def build_report(design, tests, performance, optimization, static_analysis, generate_text=True, similarity=None):
+    static_score = score_static(static_analysis["findings"])
+    # Everything the rubric needs, so rescore.py can re-mark without re-running
+    metrics = {
+        **design["metrics"], **tests["metrics"], **performance["metrics"], **optimization["metrics"],
+        **static_metrics(static_analysis["findings"]),
+    }
 
     total = (
         design["score"]
@@ -34,20 +113,93 @@ def run_orchestration(title, source_c, binary, static_report):
         "tests": tests,
         "performance": performance,
         "optimization": optimization,
-        "static_report": static_report,
+        "static_report": static_analysis["text"],
+        "static_findings": static_analysis["findings"],
         "static_score": round(static_score,2),
-        "total_score": round(min(total,100),2)
+        "similarity": similarity,
+        "metrics": metrics,
+        "total_score": round(min(total, MAX_SCORE), 2)
     }
 
-    # ✅ FINAL REPORT BY GEMINI 2.5 FLASH
-    prompt = f"""
-Generate a professional university-grade evaluation report using this data.
-No JSON. Human readable format.
-
-DATA:
-{raw_report}
-"""
-    final_text = gemini_generate_report(prompt)
-    raw_report["gemini_final_report"] = final_text if final_text else "Gemini API not configured."
+    # With generate_text=False the caller streams the text via stream_final_report()
+    if generate_text:
+        final_text = gemini_generate_report(build_report_prompt(raw_report))
+        raw_report["gemini_final_report"] = final_text if final_text else GEMINI_REPORT_FALLBACK
 
     return raw_report
+
+def stream_final_report(raw_report):
+    # Yields Gemini's report as it arrives and stores the full text for generate_pdf
+    chunks = []
+    for chunk in gemini_stream_report(build_report_prompt(raw_report)):
+        chunks.append(chunk)
+        yield chunk
+
+    if not chunks:
+        yield GEMINI_REPORT_FALLBACK
+    raw_report["gemini_final_report"] = "".join(chunks) or GEMINI_REPORT_FALLBACK
+
+# ---------------- PIPELINE GRAPH ----------------
+def _compiled(results):
+    return results["compile"]["success"]
+
+def _source_id(source_c):
+    with open(source_c, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def grading_stages(title, source_c, stream_report=False, submission_id=None):
+    # compile, cppcheck, Groq test generation and the single source-analysis
+    # pass have no dependencies and start together; the source-only agents wait
+    # for the analysis, binary runs (tests, performance, heap profile) for gcc
+    # and the inputs.
+    # submission_id names this submission in the similarity index (default:
+    # the source hash, so an identical resubmission never matches itself).
+    return {
+        "compile": ([], lambda r: compile_c_code(source_c)),
+        "static_analysis": ([], lambda r: run_cppcheck(source_c)),
+        "test_cases": ([], lambda r: generate_test_cases(title)),
+        "analysis": ([], lambda r: analyze_source(source_c)),
+        "design": (["analysis"], lambda r: design_agent(source_c, r["analysis"])),
+        "optimization": (["compile", "test_cases", "analysis"], lambda r: optimization_agent(
+            source_c, r["analysis"], r["compile"]["binary"] if _compiled(r) else None, r["test_cases"])),
+        "similarity": (["analysis"], lambda r: check_similarity(
+            title, r["analysis"], submission_id or _source_id(source_c))),
+        "tests": (["compile", "test_cases"], lambda r: test_agent(
+            title, source_c, r["compile"]["binary"], r["test_cases"]) if _compiled(r) else None),
+        "performance": (["compile", "test_cases", "analysis"], lambda r: performance_agent(
+            source_c, r["compile"]["binary"], r["test_cases"], r["analysis"], title) if _compiled(r) else None),
+        "compile_explanation": (["compile"], lambda r: None if _compiled(r)
+            else explain_compiler_errors(r["compile"]["errors"])),
+        "report": (["compile", "design", "tests", "performance", "optimization", "static_analysis", "similarity"],
+            lambda r: build_report(
+                r["design"], r["tests"], r["performance"], r["optimization"], r["static_analysis"],
+                generate_text=not stream_report, similarity=r["similarity"]) if _compiled(r) else None),
+    }
+
+def grade_submission(title, source_c, on_stage_done=None, stream_report=False, submission_id=None):
+    # Full pipeline for one submission. "report" is None when gcc failed; the
+    # Gemini explanation of the gcc log is in "compile_explanation" instead.
+    # With stream_report=True the report has scores only and the caller streams
+    # the Gemini text with stream_final_report().
+    # Timing spans of every stage end up in report["spans"]; a caller that
+    # opens its own tracing.collect() block shares the same list.
+    with tracing.collect() as spans:
+        results = run_stage_graph(grading_stages(title, source_c, stream_report, submission_id), on_stage_done=on_stage_done)
+    if results["report"] is not None:
+        results["report"]["spans"] = spans
+    return results
+
+def run_orchestration(title, source_c, binary, static_analysis, test_cases=None, submission_id=None):
+    # Already compiled and statically analysed: only the agents and report stages run
+    initial = {
+        "compile": {"success": True, "errors": "", "binary": binary},
+        "static_analysis": static_analysis,
+        "compile_explanation": None,
+    }
+    if test_cases is not None:
+        initial["test_cases"] = test_cases
+
+    with tracing.collect() as spans:
+        results = run_stage_graph(grading_stages(title, source_c, submission_id=submission_id), initial=initial)
+    results["report"]["spans"] = spans
+    return results["report"]
@@ -0,0 +1,104 @@
+import argparse
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from config import REFERENCE_DB, REFERENCE_MAX_OUTPUTS, TEST_PARALLELISM
+from kvstore import KVStore
+from runner import run_binary, discard_spills
+from test_store import normalize_title
+from tracing import traced
+from utils import build_program
+
+# Reference solutions as the test oracle. An instructor registers a C solution
+# per problem title; it is compiled once and run on every test input (whether
+# Groq's or a pinned suite's), and its stdout becomes the expected output, so
+# grading no longer trusts LLM-written answers. Outputs are memoized by
+# (solution hash, input hash): later submissions pay no reference runs at all.
+
+# Solutions are pinned entries ("solution:<title>"), so only memoized outputs are evicted
+_store = KVStore(REFERENCE_DB, max_entries=REFERENCE_MAX_OUTPUTS)
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _stdin(tc):
+    # Same stdin run_test_case feeds the student's program
+    input_val = str(tc.get("input", ""))
+    if not input_val.endswith("\n"):
+        input_val += "\n"
+    return input_val.encode()
+
+# ---------------- REGISTRY ----------------
+def register_reference(title, source):
+    _store.put(f"solution:{normalize_title(title)}", source, pinned=True)
+
+def drop_reference(title):
+    _store.delete(f"solution:{normalize_title(title)}")
+
+def get_reference(title):
+    return _store.get(f"solution:{normalize_title(title)}")
+
+# ---------------- ORACLE ----------------
+def _reference_output(binary, input_data):
+    run = run_binary(binary, input_data)
+    discard_spills(run)
+    if run["timed_out"] or run["limit"] or run["returncode"] != 0 or run["truncated"]:
+        return None  # not an answer to grade against; the suite's value stays
+    return run["stdout"].decode(errors="replace").strip()
+
+@traced
+def with_reference_outputs(title, test_cases):
+    # Test cases with "expected" from the reference solution (unchanged if none is registered)
+    source = get_reference(title) if title else None
+    if source is None:
+        return test_cases
+
+    solution = _sha(source.encode())
+    inputs = [_stdin(tc) for tc in test_cases]
+    keys = [f"output:{solution}:{_sha(data)}" for data in inputs]
+    outputs = [_store.get(key) for key in keys]
+
+    missing = [i for i, out in enumerate(outputs) if out is None]
+    if missing:
+        try:
+            binary = build_program(source)
+        except ValueError:
+            return test_cases  # does not build on this host (e.g. another gcc): keep the suite
+        contexts = [contextvars.copy_context() for _ in missing]
+        with ThreadPoolExecutor(max_workers=min(TEST_PARALLELISM, len(missing))) as pool:
+            fresh = list(pool.map(lambda ctx, i: ctx.run(_reference_output, binary, inputs[i]), contexts, missing))
+        for i, out in zip(missing, fresh):
+            outputs[i] = out
+            if out is not None:
+                _store.put(keys[i], out)
+
+    return [
+        {**tc, "expected": out, "expected_source": "reference"} if out is not None else tc
+        for tc, out in zip(test_cases, outputs)
+    ]
+
+# ---------------- CLI ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage reference solutions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add", help="Register a reference solution for a problem title")
+    add.add_argument("title")
+    add.add_argument("source_c")
+
+    show = sub.add_parser("show", help="Print the reference solution for a title")
+    show.add_argument("title")
+
+    drop = sub.add_parser("drop", help="Remove the reference solution for a title")
+    drop.add_argument("title")
+
+    args = parser.parse_args()
+    if args.command == "add":
+        with open(args.source_c, encoding="utf-8") as f:
+            source = f.read()
+        build_program(source)  # refuse a solution that does not compile
+        register_reference(args.title, source)
+    elif args.command == "show":
+        print(get_reference(args.title))
+    elif args.command == "drop":
+        drop_reference(args.title)
@@ -0,0 +1,115 @@
+"""
+rescore.py
+Re-mark a graded cohort under a changed rubric without running anything.
+
+Usage:
+    python rescore.py results.jsonl --save cohort.npz
+    python rescore.py cohort.npz --rubric rubric.json -o rescored.csv
+
+The input is a batch.py results file or the columnar .npz built from one
+(one array per raw metric, row i = submission i). A rubric file overrides
+config.WEIGHTS / config.RUBRIC, e.g.
+    {"weights": {"tests": 40, "design": 5},
+     "rubric": {"performance": {"slow_seconds": 1.0}}}
+and every score is recomputed with NumPy from the stored metrics.
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+import numpy as np
+from rubric import CATEGORIES, COLUMNS, score, merge_rubric
+
+METRIC_NAMES = [name for category in CATEGORIES for name in COLUMNS[category]]
+
+# ---------------- COHORT FILE ----------------
+def build_cohort(results_path):
+    # Rows for graded and non-compiling submissions; errors and reports from
+    # before raw metrics were stored cannot be re-marked and are skipped
+    ids, titles, recorded, compiled, rows = [], [], [], [], []
+    skipped = 0
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" in record:
+                skipped += 1
+                continue
+            if record["compiled"]:
+                metrics = record["report"].get("metrics")
+                if metrics is None:
+                    skipped += 1
+                    continue
+            else:
+                metrics = {}
+            ids.append(record["id"])
+            titles.append(record["title"])
+            recorded.append(record["total_score"])
+            compiled.append(record["compiled"])
+            rows.append([metrics.get(name, 0) for name in METRIC_NAMES])
+
+    table = np.array(rows, dtype=float).reshape(len(rows), len(METRIC_NAMES))
+    cohort = {name: table[:, i] for i, name in enumerate(METRIC_NAMES)}
+    cohort.update({
+        "id": np.array(ids, dtype=str),
+        "title": np.array(titles, dtype=str),
+        "recorded_total": np.array(recorded, dtype=float),
+        "compiled": np.array(compiled, dtype=bool),
+    })
+    return cohort, skipped
+
+def save_cohort(path, cohort):
+    np.savez_compressed(path, **cohort)
+
+def load_cohort(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+# ---------------- RESCORE ----------------
+def rescore(cohort, weights, rubric):
+    scores = score({name: cohort[name] for name in METRIC_NAMES}, weights, rubric)
+    # Nothing else is scored when gcc failed
+    return {name: np.where(cohort["compiled"], values, 0.0) for name, values in scores.items()}
+
+def write_csv(path, cohort, scores):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "title", "recorded_total", *CATEGORIES, "total"])
+        for i in range(len(cohort["id"])):
+            writer.writerow([cohort["id"][i], cohort["title"][i], cohort["recorded_total"][i],
+                             *(round(float(scores[c][i]), 2) for c in CATEGORIES), float(scores["total"][i])])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score a cohort from stored raw metrics")
+    parser.add_argument("source", help="batch.py results JSONL or a cohort .npz")
+    parser.add_argument("--save", help="Write the cohort metrics as .npz")
+    parser.add_argument("--rubric", help="JSON file with weights / rubric overrides")
+    parser.add_argument("-o", "--output", help="Write the new scores as CSV")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.source.endswith(".npz"):
+        cohort = load_cohort(args.source)
+    else:
+        cohort, skipped = build_cohort(args.source)
+        if skipped:
+            print(f"Skipped {skipped} records without raw metrics", file=sys.stderr)
+    if args.save:
+        save_cohort(args.save, cohort)
+
+    overrides = {}
+    if args.rubric:
+        with open(args.rubric, encoding="utf-8") as f:
+            overrides = json.load(f)
+    scores = rescore(cohort, *merge_rubric(overrides))
+
+    changed = int(np.sum(np.abs(scores["total"] - cohort["recorded_total"]) >= 0.01))
+    print(f"{len(cohort['id'])} submissions re-scored in {time.perf_counter() - started:.3f}s; "
+          f"mean total {cohort['recorded_total'].mean() if len(cohort['id']) else 0:.2f} -> "
+          f"{scores['total'].mean() if len(cohort['id']) else 0:.2f}, {changed} changed", file=sys.stderr)
+    if args.output:
+        write_csv(args.output, cohort, scores)
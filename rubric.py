@@ -0,0 +1,95 @@
+import json
+import numpy as np
+from config import WEIGHTS, RUBRIC
+from complexity import MODELS
+
+# Scores from raw metrics. Every agent records what it measured ("metrics" in
+# its result) and gets its score from here; the same vectorised formulas score
+# a single submission (one-row columns) or a whole cohort loaded from a .npz
+# file (rescore.py), so changing the rubric never needs gcc, binaries or LLMs.
+
+CATEGORIES = ("design", "tests", "performance", "optimization", "static")
+COMPLEXITY_CLASSES = [name for name, _ in MODELS] + ["O(2ⁿ)"]
+STATIC_SEVERITIES = list(RUBRIC["static"]["severity_penalty"]) + ["other"]
+
+# Metric columns per category (booleans are stored as 0/1)
+COLUMNS = {
+    "design": ("lines", "functions", "comments"),
+    "tests": ("tests_passed", "tests_total"),
+    "performance": ("cpu_time", "complexity_class", "loops", "branches"),
+    "optimization": ("heap_profiled", "leaked_blocks", "allocs", "unfreed_malloc", "output_in_loop"),
+    "static": tuple(f"static_{sev}" for sev in STATIC_SEVERITIES),
+}
+
+# ---------------- METRICS ----------------
+def complexity_code(name):
+    # Index into COMPLEXITY_CLASSES; -1 when the probe could not classify
+    return COMPLEXITY_CLASSES.index(name) if name in COMPLEXITY_CLASSES else -1
+
+def static_metrics(findings):
+    counts = dict.fromkeys(COLUMNS["static"], 0)
+    for f in findings:
+        sev = f["severity"] if f["severity"] in RUBRIC["static"]["severity_penalty"] else "other"
+        counts[f"static_{sev}"] += 1
+    return counts
+
+def merge_rubric(overrides):
+    # {"weights": {...}, "rubric": {"performance": {"slow_seconds": 1.0}}} over the config values
+    weights = {**WEIGHTS, **overrides.get("weights", {})}
+    rubric = json.loads(json.dumps(RUBRIC))
+    for category, values in overrides.get("rubric", {}).items():
+        for key, value in values.items():
+            if isinstance(value, dict):
+                rubric[category][key] = {**rubric[category].get(key, {}), **value}
+            else:
+                rubric[category][key] = value
+    return weights, rubric
+
+# ---------------- SCORING ----------------
+def _design(m, r, w):
+    return w - (r["long_penalty"] * (m["lines"] > r["max_lines"])
+                + r["few_functions_penalty"] * (m["functions"] < r["min_functions"])
+                + r["few_comments_penalty"] * (m["comments"] < r["min_comments"]))
+
+def _tests(m, r, w):
+    return np.round(w * m["tests_passed"] / np.maximum(m["tests_total"], 1), 2)
+
+def _performance(m, r, w):
+    table = np.array([r["complexity_penalty"].get(name, 0) for name in COMPLEXITY_CLASSES] + [0], dtype=float)
+    code = m["complexity_class"].astype(int)
+    # code -1 picks the trailing 0; the loop-count guess applies instead
+    growth = np.where(code >= 0, table[code], r["loops_penalty"] * (m["loops"] > r["max_loops"]))
+    return w - (r["slow_penalty"] * (m["cpu_time"] > r["slow_seconds"])
+                + r["very_slow_penalty"] * (m["cpu_time"] > r["very_slow_seconds"])
+                + growth
+                + r["branches_penalty"] * (m["branches"] > r["max_branches"]))
+
+def _optimization(m, r, w):
+    measured = r["leak_penalty"] * (m["leaked_blocks"] > 0) + r["churn_penalty"] * (m["allocs"] > r["churn_allocs"])
+    guessed = r["unfreed_malloc_penalty"] * m["unfreed_malloc"]
+    return w - (np.where(m["heap_profiled"] > 0, measured, guessed)
+                + r["output_in_loop_penalty"] * m["output_in_loop"])
+
+def _static(m, r, w):
+    penalty = sum(m[f"static_{sev}"] * r["severity_penalty"].get(sev, r["other_penalty"])
+                  for sev in STATIC_SEVERITIES)
+    return w - penalty
+
+_SCORERS = {"design": _design, "tests": _tests, "performance": _performance,
+            "optimization": _optimization, "static": _static}
+
+def score(columns, weights=WEIGHTS, rubric=RUBRIC):
+    # columns: {metric: array}; returns {category: array, "total": array}
+    m = {name: np.asarray(values, dtype=float) for name, values in columns.items()}
+    scores = {
+        category: np.maximum(_SCORERS[category](m, rubric.get(category, {}), weights[category]), 0)
+        for category in CATEGORIES
+    }
+    scores["total"] = np.round(np.minimum(sum(scores.values()), sum(weights.values())), 2)
+    return scores
+
+def score_category(category, metrics):
+    # One submission, one category, as a plain number
+    m = {name: np.asarray([value], dtype=float) for name, value in metrics.items()}
+    value = float(np.maximum(_SCORERS[category](m, RUBRIC.get(category, {}), WEIGHTS[category]), 0)[0])
+    return int(value) if value.is_integer() else round(value, 2)
@@ -0,0 +1,358 @@
+import math
+import os
+import resource
+import select
+import selectors
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from config import (
+    TEST_TIMEOUT_SECONDS, OUTPUT_CAP_BYTES, OUTPUT_OVERFLOW,
+    SANDBOX_MEMORY_BYTES, SANDBOX_MAX_PROCESSES, SANDBOX_MAX_FILE_BYTES
+)
+
+# Runs a student binary once and reports what the kernel measured for it.
+# The child is reaped with wait4() instead of Popen.wait(), which gives the
+# user/sys CPU time and peak RSS of that child alone: unlike wall-clock time
+# these do not move with process spawn jitter or other jobs on the host.
+# Peak RSS is the exception: Linux carries the forked grader's pre-exec
+# high-water mark into ru_maxrss. A fresh exec therefore samples the child's own
+# VmHWM from /proc while it runs, and only trusts ru_maxrss when it is clearly
+# above the grader's RSS at spawn. max_rss_kb is None when neither saw it
+# (a program that exits within a few ms). Fork-server children never exec a
+# large process, so their ru_maxrss is used as is.
+#
+# stdout/stderr are captured through a byte cap so a program printing in a
+# tight loop cannot grow the worker's memory: past OUTPUT_CAP_BYTES the child
+# is either killed ("kill") or the rest is spilled to a temp file ("spill").
+#
+# Every run is sandboxed: CPU time, address space, process count and file size
+# are capped with rlimits, the child leads its own process group (so a kill
+# takes out anything it forked, including children that outlive it) and runs
+# in a private scratch directory. "limit" in the result names what stopped it.
+#
+# make_on_stdout, if given, is called once per attempt and returns a callback
+# that sees every stdout chunk as it arrives (the streaming checker); returning
+# True kills the child there and the run is "aborted". A run retried on a fresh
+# exec after its fork server died so gets a callback that saw none of the lost output.
+# env adds variables to the child's environment (e.g. LD_PRELOAD for memprof);
+# such runs always exec, since a fork server's environment is fixed at start.
+
+READ_CHUNK = 64 * 1024
+RSS_SAMPLE_SECONDS = 0.005
+RSS_BASELINE_MARGIN_KB = 4096
+
+class _Capture:
+    def __init__(self, cap, overflow, on_data=None):
+        self.cap = cap
+        self.overflow = overflow
+        self.on_data = on_data
+        self.head = bytearray()
+        self.total = 0
+        self.spill = None
+
+    def feed(self, data):
+        # Returns why the child should be killed ("aborted" / "output_limit") or None
+        if self.on_data is not None and self.on_data(data):
+            self.total += len(data)
+            self.head += data[:max(0, self.cap - len(self.head))]
+            return "aborted"
+        self.total += len(data)
+        room = self.cap - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return None
+        if self.overflow == "spill":
+            if self.spill is None:
+                self.spill = tempfile.NamedTemporaryFile(prefix="autograder-out-", delete=False)
+            self.spill.write(data)
+            return None
+        return "output_limit"
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+
+    def spill_path(self):
+        return self.spill.name if self.spill is not None else None
+
+def _pump(proc, input_data, deadline, stdout, stderr, on_tick=None):
+    # Feed stdin and drain stdout/stderr together so neither side can block on
+    # a full pipe; returns why we stopped early ("timeout" / "output_limit" /
+    # "aborted") or None. on_tick is called at least every RSS_SAMPLE_SECONDS.
+    sel = selectors.DefaultSelector()
+    captures = {proc.stdout.fileno(): stdout, proc.stderr.fileno(): stderr}
+    for stream in (proc.stdout, proc.stderr):
+        sel.register(stream, selectors.EVENT_READ)
+
+    view = memoryview(input_data)
+    offset = 0
+    if input_data:
+        sel.register(proc.stdin, selectors.EVENT_WRITE)
+    else:
+        proc.stdin.close()
+
+    try:
+        while sel.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "timeout"
+            if on_tick is not None:
+                on_tick()
+                remaining = min(remaining, RSS_SAMPLE_SECONDS)
+            for key, _ in sel.select(remaining):
+                if key.fileobj is proc.stdin:
+                    try:
+                        offset += os.write(key.fd, view[offset:offset + select.PIPE_BUF])
+                    except BrokenPipeError:
+                        offset = len(view)  # child stopped reading; not our problem
+                    if offset >= len(view):
+                        sel.unregister(proc.stdin)
+                        proc.stdin.close()
+                    continue
+
+                data = os.read(key.fd, READ_CHUNK)
+                if not data:
+                    sel.unregister(key.fileobj)
+                    continue
+                stop_reason = captures[key.fd].feed(data)
+                if stop_reason:
+                    return stop_reason
+    finally:
+        sel.close()
+
+    return None
+
+# ---------------- SANDBOX ----------------
+def _rlimits(timeout):
+    cpu = max(1, math.ceil(timeout))
+    return [
+        (resource.RLIMIT_CPU, (cpu, cpu + 1)),  # SIGXCPU at the soft limit, SIGKILL at the hard
+        (resource.RLIMIT_AS, (SANDBOX_MEMORY_BYTES, SANDBOX_MEMORY_BYTES)),
+        (resource.RLIMIT_NPROC, (SANDBOX_MAX_PROCESSES, SANDBOX_MAX_PROCESSES)),
+        (resource.RLIMIT_FSIZE, (SANDBOX_MAX_FILE_BYTES, SANDBOX_MAX_FILE_BYTES)),
+        (resource.RLIMIT_CORE, (0, 0)),
+    ]
+
+# preexec_fn can deadlock a child forked from a threaded process, so the child
+# stops itself in /bin/sh, gets its limits through prlimit() and only then execs
+_HOLD = ["/bin/sh", "-c", 'kill -STOP $$; exec "$@"', "autograder-hold"]
+
+def _spawn(argv, limits, **popen_kwargs):
+    proc = subprocess.Popen(_HOLD + argv, start_new_session=True, **popen_kwargs)
+    try:
+        _, status = os.waitpid(proc.pid, os.WUNTRACED)
+        if not os.WIFSTOPPED(status):
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            raise RuntimeError(f"sandbox launcher exited before exec (status {proc.returncode})")
+        for which, value in limits:
+            resource.prlimit(proc.pid, which, value)
+        os.kill(proc.pid, signal.SIGCONT)
+    except BaseException:
+        _kill_group(proc.pid)
+        proc.wait()
+        for stream in (proc.stdin, proc.stdout, proc.stderr):
+            if stream is not None:
+                stream.close()
+        raise
+    return proc
+
+def _kill_group(pgid):
+    # True if anything was left in the group to kill
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+        return True
+    except ProcessLookupError:
+        return False
+
+def _cpu_limit(limits):
+    return limits[0][1][0]
+
+def _limit_hit(status, usage, stop_reason, cpu_limit, max_rss_kb):
+    if stop_reason == "timeout":
+        return "wall_time"
+    if stop_reason == "output_limit":
+        return "output"
+    if stop_reason == "aborted":
+        return None  # we killed it on purpose; not a sandbox limit
+    if os.WIFSIGNALED(status):
+        sig = os.WTERMSIG(status)
+        if sig == signal.SIGXCPU or (sig == signal.SIGKILL and usage.ru_utime + usage.ru_stime >= cpu_limit):
+            return "cpu_time"
+        if sig == signal.SIGXFSZ:
+            return "file_size"
+    # A failed allocation surfaces as a crash or an error exit; only the child's
+    # own peak RSS close to the cap tells it apart (an oversized single malloc
+    # cannot be seen, and an unmeasured peak never counts)
+    crashed = os.WIFSIGNALED(status) or os.WEXITSTATUS(status) != 0
+    if crashed and max_rss_kb is not None and max_rss_kb * 1024 >= 0.75 * SANDBOX_MEMORY_BYTES:
+        return "memory"
+    return None
+
+def _signal_name(sig):
+    try:
+        return signal.Signals(sig).name
+    except ValueError:
+        return f"signal {sig}"
+
+def _reap(proc, deadline, stop_reason, on_tick=None):
+    # The child may close its pipes and keep running, so poll until the deadline
+    while stop_reason is None:
+        if on_tick is not None:
+            on_tick()
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            return status, usage, None
+        if time.monotonic() >= deadline:
+            stop_reason = "timeout"
+            break
+        time.sleep(0.002)
+
+    _kill_group(proc.pid)
+    _, status, usage = os.wait4(proc.pid, 0)
+    return status, usage, stop_reason
+
+# ---------------- PEAK RSS ----------------
+def _status_fields(pid):
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                fields[key] = value.strip()
+    except OSError:
+        pass
+    return fields
+
+def _hwm_kb(fields):
+    try:
+        return int(fields["VmHWM"].split()[0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+class _PeakRss:
+    # The child's own VmHWM, sampled only once it has exec'd the binary
+    def __init__(self, binary_path):
+        self.name = os.path.basename(binary_path)[:15]
+        self.baseline_kb = _hwm_kb(_status_fields("self")) or 0
+        self.pid = None
+        self.hwm_kb = None
+        self.next_sample = 0.0
+
+    def sample(self):
+        now = time.monotonic()
+        if self.pid is None or now < self.next_sample:
+            return
+        self.next_sample = now + RSS_SAMPLE_SECONDS
+        fields = _status_fields(self.pid)
+        hwm = _hwm_kb(fields)
+        if hwm is not None and fields.get("Name") == self.name:
+            self.hwm_kb = max(self.hwm_kb or 0, hwm)
+
+    def peak_kb(self, usage):
+        # ru_maxrss only counts when the child clearly outgrew the grader it forked from
+        if usage.ru_maxrss > self.baseline_kb + RSS_BASELINE_MARGIN_KB:
+            return max(usage.ru_maxrss, self.hwm_kb or 0)
+        return self.hwm_kb
+
+# Binaries with a live fork server (see forkserver.py) are run through it
+_forkservers = {}
+
+def register_forkserver(binary_path, server):
+    _forkservers[os.path.abspath(binary_path)] = server
+
+def unregister_forkserver(binary_path):
+    _forkservers.pop(os.path.abspath(binary_path), None)
+
+def run_binary(binary_path, input_data=b"", timeout=TEST_TIMEOUT_SECONDS,
+               output_cap=OUTPUT_CAP_BYTES, overflow=OUTPUT_OVERFLOW, make_on_stdout=None, env=None):
+    server = _forkservers.get(os.path.abspath(binary_path))
+    if server is not None and env is None:
+        run = server.run(input_data, timeout, output_cap, overflow, make_on_stdout and make_on_stdout())
+        if run is not None:
+            return run  # None: the server is gone, fall back to a fresh exec
+
+    start = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    stdout = _Capture(output_cap, overflow, make_on_stdout and make_on_stdout())
+    stderr = _Capture(output_cap, overflow)
+    limits = _rlimits(timeout)
+    scratch = tempfile.mkdtemp(prefix="autograder-run-")
+    peak = _PeakRss(binary_path)
+    try:
+        proc = _spawn(
+            [os.path.abspath(binary_path)], limits,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=scratch,
+            env={**os.environ, **env} if env else None
+        )
+    except BaseException:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+
+    try:
+        peak.pid = proc.pid
+        stop_reason = _pump(proc, input_data, deadline, stdout, stderr, peak.sample)
+        status, usage, stop_reason = _reap(proc, deadline, stop_reason, peak.sample)
+        # Anything the child forked and left behind dies with the group
+        stray_processes = stop_reason is None and _kill_group(proc.pid)
+    except BaseException:
+        _kill_group(proc.pid)
+        proc.wait()
+        raise
+    finally:
+        for stream in (proc.stdin, proc.stdout, proc.stderr):
+            if not stream.closed:
+                stream.close()
+        stdout.close()
+        stderr.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    # Tell Popen the child is already reaped so it never waits on the pid again
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return _result(stdout, stderr, status, usage, peak.peak_kb(usage), stop_reason,
+                   _cpu_limit(limits), stray_processes, start)
+
+def _result(stdout, stderr, status, usage, max_rss_kb, stop_reason, cpu_limit, stray_processes, start):
+    return {
+        # Bounded prefixes; the full streams are only on disk in "spill" mode
+        "stdout": bytes(stdout.head),
+        "stderr": bytes(stderr.head),
+        "stdout_bytes": stdout.total,
+        "stderr_bytes": stderr.total,
+        "truncated": stdout.total > len(stdout.head) or stderr.total > len(stderr.head),
+        "stdout_spill": stdout.spill_path(),
+        "stderr_spill": stderr.spill_path(),
+        "returncode": os.waitstatus_to_exitcode(status),
+        "timed_out": stop_reason == "timeout",
+        "output_limit": stop_reason == "output_limit",
+        "aborted": stop_reason == "aborted",
+        "limit": _limit_hit(status, usage, stop_reason, cpu_limit, max_rss_kb),
+        "signal": _signal_name(os.WTERMSIG(status)) if os.WIFSIGNALED(status) else None,
+        "stray_processes": stray_processes,
+        "wall_time": time.perf_counter() - start,
+        "user_time": usage.ru_utime,
+        "sys_time": usage.ru_stime,
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        "max_rss_kb": max_rss_kb
+    }
+
+def discard_spills(run):
+    for key in ("stdout_spill", "stderr_spill"):
+        if run.get(key):
+            try:
+                os.unlink(run[key])
+            except OSError:
+                pass
+
+def preview(text, limit):
+    # Bounded text for the UI table and the PDF
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"… ({len(text)} chars)"
@@ -0,0 +1,163 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+import numpy as np
+from config import (
+    SIMILARITY_DB, SIMILARITY_SHINGLE_SIZE, SIMILARITY_PERMUTATIONS, SIMILARITY_BANDS,
+    SIMILARITY_THRESHOLD, SIMILARITY_MIN_SHINGLES, SIMILARITY_MAX_MATCHES
+)
+from source_analysis import KEPT_IDENTIFIERS
+from test_store import normalize_title
+
+# Near-duplicate detection across a cohort without pairwise comparison.
+# Code tokens from the shared source analysis are abstracted (identifiers and
+# literals collapse to placeholders, so renaming variables changes nothing),
+# cut into overlapping shingles and summarised as a MinHash signature. The
+# signature's bands are stored in an SQLite LSH index, so a new submission
+# only meets the few earlier ones that share a band bucket; those candidates
+# are then confirmed by their estimated Jaccard similarity.
+
+PLACEHOLDERS = {"ident": "ID", "number": "NUM", "string": "STR", "char": "CHR"}
+
+ROWS_PER_BAND = SIMILARITY_PERMUTATIONS // SIMILARITY_BANDS
+
+# Multiply-shift hash family; fixed seed so signatures stay comparable across runs
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 2 ** 63, size=SIMILARITY_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_B = _rng.randint(0, 2 ** 63, size=SIMILARITY_PERMUTATIONS, dtype=np.uint64)
+
+# ---------------- FINGERPRINT ----------------
+def abstract_tokens(tokens):
+    out = []
+    for kind, text in tokens:
+        if kind == "ident" and text in KEPT_IDENTIFIERS:
+            out.append(text)
+        else:
+            out.append(PLACEHOLDERS.get(kind, text))
+    return out
+
+def shingles(tokens, k=SIMILARITY_SHINGLE_SIZE):
+    abstract = abstract_tokens(tokens)
+    return {" ".join(abstract[i:i + k]) for i in range(len(abstract) - k + 1)}
+
+def minhash(shingle_set):
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingle_set),
+        dtype=np.uint64, count=len(shingle_set)
+    )
+    # (a·x + b) mod 2^64, top 32 bits; uint64 wrap-around is the modulus
+    with np.errstate(over="ignore"):
+        values = (_A[:, None] * hashes[None, :] + _B[:, None]) >> np.uint64(32)
+    return values.min(axis=1).astype(np.uint32)
+
+def _band_keys(signature):
+    # One 63-bit bucket id per band
+    return [
+        (band, int.from_bytes(hashlib.blake2b(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes(),
+                                              digest_size=8).digest(), "little") >> 1)
+        for band in range(SIMILARITY_BANDS)
+    ]
+
+def estimate_similarity(sig_a, sig_b):
+    return float(np.mean(sig_a == sig_b))
+
+# ---------------- LSH INDEX ----------------
+class SimilarityIndex:
+    def __init__(self, path):
+        self.path = path
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS signatures (
+                    problem TEXT NOT NULL,
+                    submission TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (problem, submission)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bands (
+                    problem TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    submission TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (problem, band, bucket)")
+            conn.execute("CREATE INDEX IF NOT EXISTS bands_owner ON bands (problem, submission)")
+            self._ready = True
+        return conn
+
+    def query(self, problem, signature, exclude=None):
+        keys = _band_keys(signature)
+        with self._connect() as conn:
+            placeholders = ", ".join("(?, ?)" for _ in keys)
+            rows = conn.execute(f"""
+                WITH probe(band, bucket) AS (VALUES {placeholders})
+                SELECT DISTINCT s.submission, s.signature, s.created
+                FROM probe
+                JOIN bands b ON b.problem = ? AND b.band = probe.band AND b.bucket = probe.bucket
+                JOIN signatures s ON s.problem = b.problem AND s.submission = b.submission
+            """, [v for key in keys for v in key] + [problem]).fetchall()
+
+        matches = []
+        for submission, blob, created in rows:
+            if submission == exclude:
+                continue
+            score = estimate_similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if score >= SIMILARITY_THRESHOLD:
+                matches.append({"submission": submission, "similarity": round(score, 3), "created": created})
+        matches.sort(key=lambda m: -m["similarity"])
+        return matches[:SIMILARITY_MAX_MATCHES]
+
+    def add(self, problem, submission, signature):
+        with self._connect() as conn:
+            # Re-grading the same submission replaces its old entry
+            conn.execute("DELETE FROM bands WHERE problem = ? AND submission = ?", (problem, submission))
+            conn.execute(
+                "INSERT OR REPLACE INTO signatures (problem, submission, signature, created) VALUES (?, ?, ?, ?)",
+                (problem, submission, signature.tobytes(), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO bands (problem, band, bucket, submission) VALUES (?, ?, ?, ?)",
+                [(problem, band, bucket, submission) for band, bucket in _band_keys(signature)]
+            )
+
+    def drop_problem(self, problem):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM bands WHERE problem = ?", (problem,))
+            conn.execute("DELETE FROM signatures WHERE problem = ?", (problem,))
+
+_index = SimilarityIndex(SIMILARITY_DB)
+
+def check_similarity(title, analysis, submission_id):
+    # Matches against earlier submissions for the same problem, then indexes this one
+    shingle_set = shingles(analysis["tokens"])
+    if len(shingle_set) < SIMILARITY_MIN_SHINGLES:
+        return {"checked": False, "shingles": len(shingle_set), "matches": []}
+
+    problem = normalize_title(title)
+    signature = minhash(shingle_set)
+    matches = _index.query(problem, signature, exclude=submission_id)
+    _index.add(problem, submission_id, signature)
+    return {"checked": True, "shingles": len(shingle_set), "matches": matches}
+
+# ---------------- CLI ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the near-duplicate index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    drop = sub.add_parser("drop", help="Forget every fingerprint for a problem title")
+    drop.add_argument("title")
+    args = parser.parse_args()
+
+    if args.command == "drop":
+        _index.drop_problem(normalize_title(args.title))
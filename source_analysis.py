@@ -0,0 +1,175 @@
+import re
+
+# One linear pass over a submission shared by every source-reading agent.
+# A single compiled token regex splits the file into comments, string/char
+# literals, preprocessor lines and code tokens; everything structural
+# (functions, loops and their nesting, branches, malloc/free sites, output
+# calls inside loops) is then derived from the code tokens only, so text in
+# comments and string literals can no longer trigger a rule.
+
+_TOKEN_RE = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>"(?:[^"\\\n]|\\.)*"?)
+  | (?P<char>'(?:[^'\\\n]|\\.)*'?)
+  | (?P<preproc>^[ \t]*\#(?:[^\n\\]|\\.)*)
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)
+  | (?P<newline>\n)
+  | (?P<space>[ \t\r\f\v]+)
+  | (?P<punct>.)
+""", re.S | re.M | re.X)
+
+CONTROL_KEYWORDS = {"if", "else", "for", "while", "do", "switch", "case", "return", "sizeof"}
+ALLOC_FUNCS = {"malloc", "calloc", "realloc"}
+OUTPUT_FUNCS = {"printf", "puts", "putchar", "fprintf", "fputs", "putc", "fputc"}
+C_KEYWORDS = {
+    "auto", "break", "case", "char", "const", "continue", "default", "do", "double", "else",
+    "enum", "extern", "float", "for", "goto", "if", "inline", "int", "long", "register",
+    "restrict", "return", "short", "signed", "sizeof", "static", "struct", "switch", "typedef",
+    "union", "unsigned", "void", "volatile", "while", "bool", "true", "false", "NULL", "main",
+}
+# Names that are part of C rather than a student's choice; similarity and
+# explain_store keep these verbatim and abstract every other identifier
+KEPT_IDENTIFIERS = C_KEYWORDS | ALLOC_FUNCS | OUTPUT_FUNCS | {
+    "free", "scanf", "getchar", "gets", "fgets", "sscanf", "fscanf", "strlen", "strcpy",
+    "strcmp", "memcpy", "memset", "qsort", "abs", "sqrt", "pow",
+}
+
+def tokenize(src):
+    # Returns (code_tokens, comment_count); code tokens are (kind, text, line)
+    tokens = []
+    comments = 0
+    line = 1
+    for m in _TOKEN_RE.finditer(src):
+        kind = m.lastgroup
+        text = m.group()
+        if kind == "comment":
+            comments += 1
+        elif kind not in ("newline", "space", "preproc"):
+            tokens.append((kind, text, line))
+        if kind in ("newline", "comment", "preproc"):
+            line += text.count("\n")
+    return tokens, comments
+
+def _match_paren(tokens, i):
+    # tokens[i] is "("; returns the index of its matching ")"
+    depth = 0
+    for j in range(i, len(tokens)):
+        text = tokens[j][1]
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(tokens) - 1
+
+def _text(tokens, i):
+    return tokens[i][1] if i < len(tokens) else ""
+
+def analyze_source(source_path):
+    try:
+        src = open(source_path, encoding="utf-8", errors="ignore").read()
+    except Exception:
+        src = ""
+    return analyze_text(src)
+
+def analyze_text(src):
+    tokens, comments = tokenize(src)
+
+    functions = []
+    loops = 0
+    branches = 0
+    max_loop_depth = 0
+    malloc_sites = []
+    free_sites = []
+    output_in_loop = []
+
+    # Block stack entries: (loops that block's "{" opened, is a do-body)
+    blocks = []
+    loop_depth = 0       # loops enclosing the current token
+    pending_loops = 0    # loop headers whose body is a single statement
+    brace_depth = 0
+    paren_depth = 0
+    do_tail = False      # the next "while" closes a do { } while (...);
+    next_block_loops = 0
+
+    i = 0
+    while i < len(tokens):
+        kind, text, line = tokens[i]
+
+        if kind == "ident":
+            nxt = _text(tokens, i + 1)
+            if text in ("for", "while") and nxt == "(":
+                close = _match_paren(tokens, i + 1)
+                after = _text(tokens, close + 1)
+                if text == "while" and (do_tail or after == ";"):
+                    do_tail = False
+                    i = close + 1
+                    continue
+                loops += 1
+                max_loop_depth = max(max_loop_depth, loop_depth + pending_loops + 1)
+                if after == "{":
+                    next_block_loops += 1
+                else:
+                    pending_loops += 1
+                # Skip the header: its ";" and calls are not part of the body
+                i = close + 1
+                continue
+            if text == "do":
+                loops += 1
+                max_loop_depth = max(max_loop_depth, loop_depth + pending_loops + 1)
+                if nxt == "{":
+                    next_block_loops += 1
+                else:
+                    pending_loops += 1
+            elif text in ("if", "switch", "case"):
+                branches += 1
+            elif nxt == "(" and text not in CONTROL_KEYWORDS:
+                if text in ALLOC_FUNCS:
+                    malloc_sites.append(line)
+                elif text == "free":
+                    free_sites.append(line)
+                elif text in OUTPUT_FUNCS and loop_depth + pending_loops > 0:
+                    output_in_loop.append(line)
+                elif brace_depth == 0:
+                    close = _match_paren(tokens, i + 1)
+                    if _text(tokens, close + 1) == "{":
+                        functions.append({"name": text, "line": line})
+
+        elif text == "(":
+            paren_depth += 1
+        elif text == ")":
+            paren_depth = max(paren_depth - 1, 0)
+        elif text == "{":
+            # A block opened by a loop header, or by a single-statement loop
+            # body that starts with a nested block statement
+            opened = next_block_loops + pending_loops
+            blocks.append((opened, i > 0 and tokens[i - 1][1] == "do"))
+            loop_depth += opened
+            next_block_loops = 0
+            pending_loops = 0
+            brace_depth += 1
+        elif text == "}":
+            if blocks:
+                opened, was_do = blocks.pop()
+                loop_depth -= opened
+                do_tail = was_do
+            brace_depth = max(brace_depth - 1, 0)
+        elif text == ";" and paren_depth == 0:
+            pending_loops = 0
+
+        i += 1
+
+    return {
+        "lines": len(src.splitlines()),
+        "comments": comments,
+        "functions": functions,
+        "loops": loops,
+        "branches": branches,
+        "max_loop_depth": max_loop_depth,
+        "malloc_sites": malloc_sites,
+        "free_sites": free_sites,
+        "output_in_loop": output_in_loop,
+        "tokens": [(kind, text) for kind, text, _ in tokens]
+    }
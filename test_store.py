@@ -0,0 +1,60 @@
+import argparse
+import json
+import re
+from config import TEST_SUITE_DB, TEST_SUITE_TTL_SECONDS, TEST_SUITE_MAX_ENTRIES
+from kvstore import KVStore
+
+# Test suites keyed by normalized problem title, so every student on the same
+# assignment is graded against the same cases and only the first submission
+# per problem pays a Groq round trip.
+
+_store = KVStore(TEST_SUITE_DB, ttl=TEST_SUITE_TTL_SECONDS, max_entries=TEST_SUITE_MAX_ENTRIES)
+
+def normalize_title(title):
+    title = re.sub(r"\s+", " ", title.strip().lower())
+    return title.rstrip(" .:;!?")
+
+def is_valid_suite(test_cases):
+    # A non-empty list of {"input", "expected"} dicts; anything else would crash grading
+    return (isinstance(test_cases, list) and len(test_cases) > 0
+            and all(isinstance(tc, dict) and "input" in tc and "expected" in tc for tc in test_cases))
+
+def get_test_suite(title):
+    return _store.get(normalize_title(title))
+
+def put_test_suite(title, test_cases):
+    _store.put(normalize_title(title), test_cases)
+
+def pin_test_suite(title, test_cases):
+    # Instructor-provided suite: never expires and is never replaced by Groq output
+    _store.put(normalize_title(title), test_cases, pinned=True)
+
+def unpin_test_suite(title):
+    _store.delete(normalize_title(title))
+
+# ---------------- CLI ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage cached / pinned test suites")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pin = sub.add_parser("pin", help="Pin an instructor test suite (JSON list of {input, expected})")
+    pin.add_argument("title")
+    pin.add_argument("suite_json")
+
+    show = sub.add_parser("show", help="Print the stored suite for a title")
+    show.add_argument("title")
+
+    drop = sub.add_parser("drop", help="Remove the stored suite for a title")
+    drop.add_argument("title")
+
+    args = parser.parse_args()
+    if args.command == "pin":
+        with open(args.suite_json, encoding="utf-8") as f:
+            suite = json.load(f)
+        if not is_valid_suite(suite):
+            parser.error("suite must be a non-empty JSON list of {\"input\", \"expected\"} objects")
+        pin_test_suite(args.title, suite)
+    elif args.command == "show":
+        print(json.dumps(get_test_suite(args.title), indent=2))
+    elif args.command == "drop":
+        unpin_test_suite(args.title)
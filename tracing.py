@@ -0,0 +1,272 @@
+import argparse
+import atexit
+import bisect
+import contextlib
+import contextvars
+import fcntl
+import functools
+import glob
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_DIR, METRICS_FILE, METRICS_FLUSH_SECONDS, METRICS_BUCKETS
+
+# Timed spans around every expensive step of a grade (gcc, cppcheck, agents,
+# LLM calls, PDF rendering). Inside collect() the spans of the current
+# submission are gathered in order for its report; every span, in a collect() block or not,
+# also lands in this process's latency histograms. Each process periodically
+# writes its histograms to METRICS_DIR as JSON and re-renders the merged
+# Prometheus text file, so job-queue and batch workers aggregate into one view.
+# Files of exited processes are folded into one cumulative file, so the
+# directory stays small and the merged counters never go backwards.
+
+log = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("autograder_trace", default=None)
+
+class _Trace:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.spans = []
+
+@contextlib.contextmanager
+def collect():
+    # Yields the span list of the current submission; nested calls share it
+    trace = _current.get()
+    if trace is not None:
+        yield trace.spans
+        return
+    trace = _Trace()
+    token = _current.set(trace)
+    try:
+        yield trace.spans
+    finally:
+        _current.reset(token)
+
+# ---------------- RECORDING ----------------
+_lock = threading.Lock()
+_histograms = {}
+_last_flush = time.monotonic()
+
+def record(name, seconds, error=None, started=None):
+    trace = _current.get()
+    if trace is not None:
+        span = {"name": name, "seconds": round(seconds, 4)}
+        if started is not None:
+            span["start"] = round(started - trace.t0, 4)
+        if error:
+            span["error"] = error
+        trace.spans.append(span)
+
+    global _last_flush
+    with _lock:
+        h = _histograms.setdefault(name, {"buckets": [0] * len(METRICS_BUCKETS), "sum": 0.0, "count": 0, "errors": 0})
+        i = bisect.bisect_left(METRICS_BUCKETS, seconds)
+        if i < len(METRICS_BUCKETS):
+            h["buckets"][i] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+        h["errors"] += bool(error)
+        due = time.monotonic() - _last_flush >= METRICS_FLUSH_SECONDS
+        if due:
+            _last_flush = time.monotonic()
+    if due:
+        try:
+            flush()
+        except OSError as e:
+            # Metrics are best effort; the traced call's own result must win
+            log.warning("Could not flush metrics to %s: %s", METRICS_DIR, e)
+
+def traced(fn=None, *, name=None):
+    # @traced or @traced(name="..."); generator functions are timed until exhausted
+    if fn is None:
+        return lambda f: traced(f, name=name)
+    span_name = name or fn.__name__
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def gen_wrapper(*args, **kwargs):
+            started, error = time.perf_counter(), None
+            try:
+                yield from fn(*args, **kwargs)
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                record(span_name, time.perf_counter() - started, error, started)
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started, error = time.perf_counter(), None
+        try:
+            return fn(*args, **kwargs)
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            record(span_name, time.perf_counter() - started, error, started)
+    return wrapper
+
+# ---------------- EXPORT ----------------
+CUMULATIVE_FILE = os.path.join(METRICS_DIR, "cumulative.json")
+
+def _start_time(pid):
+    # Kernel start time of pid (field 22 of /proc/<pid>/stat), None if unknown
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+def _alive(pid, started):
+    current = _start_time(pid)
+    if current is not None and started:
+        return current == started  # a reused pid has another start time
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# process-<pid>-<start time>.json: a reused pid never overwrites an old file
+_PROCESS_FILE = os.path.join(METRICS_DIR, f"process-{os.getpid()}-{_start_time(os.getpid()) or int(time.time())}.json")
+
+@contextlib.contextmanager
+def _dir_lock(mode):
+    # Shared for readers, exclusive while dead processes are folded in
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(os.path.join(METRICS_DIR, ".lock"), "w") as lock:
+        fcntl.flock(lock, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+    os.replace(path + ".tmp", path)
+
+def _add(merged, histograms):
+    for name, h in histograms.items():
+        m = merged.setdefault(name, {"buckets": [0] * len(METRICS_BUCKETS), "sum": 0.0, "count": 0, "errors": 0})
+        if len(h["buckets"]) != len(METRICS_BUCKETS):
+            continue  # written with a different bucket layout
+        m["buckets"] = [a + b for a, b in zip(m["buckets"], h["buckets"])]
+        m["sum"] += h["sum"]
+        m["count"] += h["count"]
+        m["errors"] += h["errors"]
+    return merged
+
+def _process_files():
+    for path in glob.glob(os.path.join(METRICS_DIR, "process-*.json")):
+        try:
+            # process-<pid>.json from older versions has no start time
+            pid, _, started = os.path.basename(path)[len("process-"):-len(".json")].partition("-")
+            yield path, int(pid), started
+        except ValueError:
+            continue
+
+def _fold_dead():
+    dead = [path for path, pid, started in _process_files() if not _alive(pid, started)]
+    if not dead:
+        return
+    with _dir_lock(fcntl.LOCK_EX):
+        cumulative = _load(CUMULATIVE_FILE)
+        dead = [path for path in dead if os.path.exists(path)]  # another process may have folded them
+        for path in dead:
+            _add(cumulative, _load(path))
+        _write_json(CUMULATIVE_FILE, cumulative)
+        for path in dead:
+            os.unlink(path)
+
+def flush():
+    with _lock:
+        snapshot = json.dumps(_histograms)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write_json(_PROCESS_FILE, snapshot)
+    _fold_dead()
+    write_metrics()
+
+def _flush_at_exit():
+    if _histograms:
+        try:
+            flush()
+        except OSError as e:
+            log.warning("Could not flush metrics to %s: %s", METRICS_DIR, e)
+
+atexit.register(_flush_at_exit)
+
+def merged_histograms():
+    with _dir_lock(fcntl.LOCK_SH):
+        merged = _add({}, _load(CUMULATIVE_FILE))
+        for path, _, _ in _process_files():
+            _add(merged, _load(path))
+    return merged
+
+def render_prometheus(histograms):
+    lines = [
+        "# HELP autograder_stage_seconds Latency of each grading stage.",
+        "# TYPE autograder_stage_seconds histogram",
+    ]
+    for name in sorted(histograms):
+        h = histograms[name]
+        cumulative = 0
+        for bound, n in zip(METRICS_BUCKETS, h["buckets"]):
+            cumulative += n
+            lines.append(f'autograder_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'autograder_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h["count"]}')
+        lines.append(f'autograder_stage_seconds_sum{{stage="{name}"}} {h["sum"]:.6f}')
+        lines.append(f'autograder_stage_seconds_count{{stage="{name}"}} {h["count"]}')
+    lines += [
+        "# HELP autograder_stage_errors_total Grading stages that raised.",
+        "# TYPE autograder_stage_errors_total counter",
+    ]
+    for name in sorted(histograms):
+        lines.append(f'autograder_stage_errors_total{{stage="{name}"}} {histograms[name]["errors"]}')
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path=METRICS_FILE):
+    # Atomic, so a node_exporter textfile collector never reads a torn file
+    text = render_prometheus(merged_histograms())
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus(merged_histograms()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+# ---------------- CLI ----------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export per-stage grading latency metrics")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Serve /metrics over HTTP instead of printing")
+    args = parser.parse_args()
+
+    if args.serve:
+        ThreadingHTTPServer(("", args.serve), _MetricsHandler).serve_forever()
+    else:
+        print(render_prometheus(merged_histograms()), end="")
@@ -1,9 +1,16 @@
-import subprocess, os, tempfile, datetime
+import subprocess, os, shutil, tempfile, datetime, functools, hashlib, json, multiprocessing, threading, time
+from concurrent.futures import Future, ProcessPoolExecutor
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
+import compile_cache
+import forkserver
+from tracing import traced, record
+from xml.etree import ElementTree
+from config import WEIGHTS, MAX_SCORE, FORKSERVER, PDF_CACHE_DIR, PDF_CACHE_MAX_FILES, PDF_WORKERS, CPPCHECK_CACHE_DIR, CPPCHECK_CACHE_MAX_ENTRIES, CPPCHECK_BATCH_BUILD_DIR, CPPCHECK_JOBS, PROGRAM_DIR
 
+@traced
 def compile_c_code(src):
     # Safer binary path generation
     if src.endswith(".c"):
@@ -12,38 +19,232 @@ def compile_c_code(src):
         bin_path = src + ".bin"
     
     # -lm links math library which is common in student code
-    proc = subprocess.run(["gcc", src, "-o", bin_path, "-lm"], capture_output=True, text=True)
-    return {"success": proc.returncode == 0, "errors": proc.stderr, "binary": bin_path}
+    flags = ["-lm"]
 
+    # Fork-server shim object (named by its content hash, so it keys the cache too)
+    link = []
+    if FORKSERVER:
+        shim = forkserver.shim_object()
+        if shim:
+            link = [shim]
+
+    # Resubmissions and shared starter code skip gcc entirely
+    with open(src, "rb") as f:
+        key = compile_cache.cache_key(f.read(), flags + [os.path.basename(obj) for obj in link])
+    cached = compile_cache.lookup(key, src, bin_path)
+    if cached:
+        return cached
+
+    proc = subprocess.run(["gcc", src] + link + ["-o", bin_path] + flags, capture_output=True, text=True)
+    result = {"success": proc.returncode == 0, "errors": proc.stderr, "binary": bin_path, "cached": False}
+    compile_cache.store(key, src, result)
+    return result
+
+_build_lock = threading.Lock()
+
+def build_program(source):
+    # Binary for an instructor's C source, raising ValueError if it does not compile.
+    # Built in a private directory and moved into place, so concurrent graders
+    # never run a half-written binary; compile_c_code's cache makes rebuilds cheap
+    binary = os.path.join(PROGRAM_DIR, hashlib.sha256(source.encode()).hexdigest(), "main")
+    with _build_lock:
+        if os.path.exists(binary):
+            return binary
+        workdir = tempfile.mkdtemp(prefix="autograder-program-")
+        try:
+            src = os.path.join(workdir, "main.c")
+            with open(src, "w", encoding="utf-8") as f:
+                f.write(source)
+            result = compile_c_code(src)
+            if not result["success"]:
+                raise ValueError(f"Program does not compile:\n{result['errors']}")
+            os.makedirs(os.path.dirname(binary), exist_ok=True)
+            os.replace(result["binary"], binary)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return binary
+
+# ---------------- CPPCHECK ----------------
+# cppcheck runs with --xml and its findings are parsed into
+# {"id", "severity", "line", "message"} dicts. Each distinct source gets a
+# content-addressed work dir holding a stable copy of the file, its
+# --cppcheck-build-dir and the parsed findings, so resubmitting identical code
+# never re-runs the analysis. run_cppcheck_batch() analyses many files in one
+# `cppcheck -j N` invocation for cohort grading.
+
+CPPCHECK_ARGS = ["cppcheck", "--enable=all", "--force", "--xml", "--xml-version=2", "--quiet"]
+
+def _cppcheck_workdir(src):
+    with open(src, "rb") as f:
+        source_bytes = f.read()
+    workdir = os.path.join(CPPCHECK_CACHE_DIR, hashlib.sha256(source_bytes).hexdigest())
+    os.makedirs(os.path.join(workdir, "build"), exist_ok=True)
+    stable_src = os.path.join(workdir, "main.c")
+    if not os.path.exists(stable_src):
+        with open(stable_src + f".{os.getpid()}", "wb") as f:
+            f.write(source_bytes)
+        os.replace(stable_src + f".{os.getpid()}", stable_src)
+    os.utime(workdir)  # recency for _evict_cppcheck_workdirs
+    return workdir, stable_src
+
+def _evict_cppcheck_workdirs():
+    try:
+        workdirs = [os.path.join(CPPCHECK_CACHE_DIR, name) for name in os.listdir(CPPCHECK_CACHE_DIR)
+                    if os.path.join(CPPCHECK_CACHE_DIR, name) != CPPCHECK_BATCH_BUILD_DIR]
+        if len(workdirs) <= CPPCHECK_CACHE_MAX_ENTRIES:
+            return
+        workdirs.sort(key=os.path.getmtime)
+        for path in workdirs[:len(workdirs) - CPPCHECK_CACHE_MAX_ENTRIES]:
+            shutil.rmtree(path, ignore_errors=True)
+    except OSError:
+        pass  # another worker evicted concurrently
+
+def parse_cppcheck_xml(xml_text):
+    # Returns {file: [finding, ...]} from cppcheck --xml-version=2 output
+    by_file = {}
+    root = ElementTree.fromstring(xml_text)
+    for error in root.iter("error"):
+        location = error.find("location")
+        path = location.get("file") if location is not None else error.get("file0", "")
+        finding = {
+            "id": error.get("id", ""),
+            "severity": error.get("severity", ""),
+            "line": int(location.get("line", 0)) if location is not None else 0,
+            "message": error.get("msg", "")
+        }
+        by_file.setdefault(path, []).append(finding)
+    return by_file
+
+def format_findings(findings):
+    # gcc-style text for the UI/PDF; informational notes (missing system headers etc.) are left out
+    return "\n".join(
+        f"main.c:{f['line']}: {f['severity']}: {f['message']} [{f['id']}]"
+        for f in findings if f["severity"] != "information"
+    )
+
+def _static_result(findings, error=None):
+    return {"findings": findings, "text": error if error else format_findings(findings), "error": error}
+
+def _load_findings(workdir):
+    try:
+        with open(os.path.join(workdir, "findings.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _store_findings(workdir, findings):
+    tmp = os.path.join(workdir, f"findings.json.{os.getpid()}")
+    with open(tmp, "w") as f:
+        json.dump(findings, f)
+    os.replace(tmp, os.path.join(workdir, "findings.json"))
+
+@traced
 def run_cppcheck(src):
     try:
+        workdir, stable_src = _cppcheck_workdir(src)
+        findings = _load_findings(workdir)
+        if findings is not None:
+            return _static_result(findings)
+
         # --force ensures all configs are checked
-        proc = subprocess.run(["cppcheck", "--enable=all", "--force", src], stderr=subprocess.PIPE, text=True)
-        return proc.stderr
+        proc = subprocess.run(
+            CPPCHECK_ARGS + [f"--cppcheck-build-dir={os.path.join(workdir, 'build')}", stable_src],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        if proc.returncode != 0 or "<results" not in proc.stderr:
+            return _static_result([], f"Error running cppcheck: {proc.stderr.strip()[:500]}")
+        findings = parse_cppcheck_xml(proc.stderr).get(stable_src, [])
+        _store_findings(workdir, findings)
+        _evict_cppcheck_workdirs()
+        return _static_result(findings)
     except FileNotFoundError:
-        return "cppcheck not installed on server."
+        return _static_result([], "cppcheck not installed on server.")
     except Exception as e:
-        return f"Error running cppcheck: {str(e)}"
+        return _static_result([], f"Error running cppcheck: {str(e)}")
+
+@traced
+def run_cppcheck_batch(sources, jobs=CPPCHECK_JOBS):
+    # Analyse every not-yet-cached source in one parallel cppcheck run; returns
+    # results in the order of `sources` and leaves them cached for run_cppcheck()
+    workdirs = [_cppcheck_workdir(src) for src in sources]
+    missing = [(workdir, stable_src) for workdir, stable_src in workdirs if _load_findings(workdir) is None]
+
+    if missing:
+        os.makedirs(CPPCHECK_BATCH_BUILD_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file_list:
+            file_list.write("\n".join(stable_src for _, stable_src in missing))
+        try:
+            proc = subprocess.run(
+                CPPCHECK_ARGS + [f"-j{jobs}", f"--cppcheck-build-dir={CPPCHECK_BATCH_BUILD_DIR}", f"--file-list={file_list.name}"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+            )
+        except FileNotFoundError:
+            return [_static_result([], "cppcheck not installed on server.") for _ in sources]
+        finally:
+            os.unlink(file_list.name)
+
+        if proc.returncode != 0 or "<results" not in proc.stderr:
+            error = f"Error running cppcheck: {proc.stderr.strip()[:500]}"
+            return [_static_result([], error) for _ in sources]
+
+        by_file = parse_cppcheck_xml(proc.stderr)
+        for workdir, stable_src in missing:
+            _store_findings(workdir, by_file.get(stable_src, []))
+
+    results = [_static_result(_load_findings(workdir) or []) for workdir, _ in workdirs]
+    _evict_cppcheck_workdirs()
+    return results
+
+# ---------------- PDF REPORTS ----------------
+# Styles are built once per process and shared by every document. PDFs are
+# content-addressed (file name = hash of the report), written to a temp file
+# and renamed into place, so concurrent graders never overwrite each other and
+# an identical report is never rendered twice.
+
+@functools.lru_cache(maxsize=None)
+def _styles():
+    return getSampleStyleSheet()
+
+SCORE_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
+    ("GRID", (0,0), (-1,-1), 1, colors.black),
+    ("ALIGN", (1,1), (-1,-1), "CENTER"),
+    ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+    ("BOTTOMPADDING", (0,0), (-1,0), 10)
+])
+
+TEST_TABLE_STYLE = TableStyle([
+    ("GRID", (0,0), (-1,-1), 1, colors.black),
+    ("BACKGROUND", (0,0), (-1,0), colors.lightgrey)
+])
+
+def report_hash(report):
+    # Timing spans and measured CPU time / peak memory / complexity series differ
+    # on every run, so they do not key the PDF; a regrade that only moves them
+    # (the scores, complexity class and all other text being equal) reuses it
+    content = {k: v for k, v in report.items() if k != "spans"}
+    performance = content.get("performance")
+    if isinstance(performance, dict):
+        content["performance"] = {
+            "score": performance.get("score"),
+            "complexity": (performance.get("complexity") or {}).get("class"),
+        }
+    if isinstance(content.get("metrics"), dict):
+        content["metrics"] = {k: v for k, v in content["metrics"].items() if k != "cpu_time"}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+def pdf_path_for(report):
+    return os.path.join(PDF_CACHE_DIR, f"C_Autograder_Final_Report_{report_hash(report)[:24]}.pdf")
+
+def _report_elements(report):
+    styles = _styles()
 
-def generate_pdf(report):
     # Handle missing keys gracefully
     gemini_text = report.get("gemini_final_report", "Not available.")
     
     # FIX: ReportLab Paragraphs ignore \n. Replace with <br /> for proper formatting.
     gemini_text = gemini_text.replace("\n", "<br />")
 
-    path = f"{tempfile.gettempdir()}/C_Autograder_Final_Report_{int(datetime.datetime.now().timestamp())}.pdf"
-
-    styles = getSampleStyleSheet()
-    doc = SimpleDocTemplate(
-        path,
-        pagesize=A4,
-        rightMargin=40,
-        leftMargin=40,
-        topMargin=40,
-        bottomMargin=40
-    )
-
     elements = []
 
     # -------- TITLE --------
@@ -54,27 +255,21 @@ def generate_pdf(report):
 
     # -------- FINAL SCORE --------
     elements.append(Paragraph("FINAL SCORE", styles["Heading2"]))
-    elements.append(Paragraph(f"{report['total_score']} / 100", styles["Heading1"]))
+    elements.append(Paragraph(f"{report['total_score']} / {MAX_SCORE:g}", styles["Heading1"]))
     elements.append(Spacer(1, 16))
 
     # -------- SCORE SUMMARY TABLE --------
     data = [
         ["Component", "Score"],
-        ["Design Quality", f"{report['design']['score']} / 15"],
-        ["Functional Tests", f"{report['tests']['score']} / 30"],
-        ["Performance", f"{report['performance']['score']} / 15"],
-        ["Optimization", f"{report['optimization']['score']} / 20"],
-        ["Static Analysis (cppcheck)", f"{report['static_score']} / 20"]
+        ["Design Quality", f"{report['design']['score']} / {WEIGHTS['design']:g}"],
+        ["Functional Tests", f"{report['tests']['score']} / {WEIGHTS['tests']:g}"],
+        ["Performance", f"{report['performance']['score']} / {WEIGHTS['performance']:g}"],
+        ["Optimization", f"{report['optimization']['score']} / {WEIGHTS['optimization']:g}"],
+        ["Static Analysis (cppcheck)", f"{report['static_score']} / {WEIGHTS['static']:g}"]
     ]
 
     table = Table(data, colWidths=[280, 180])
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
-        ("GRID", (0,0), (-1,-1), 1, colors.black),
-        ("ALIGN", (1,1), (-1,-1), "CENTER"),
-        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-        ("BOTTOMPADDING", (0,0), (-1,0), 10)
-    ]))
+    table.setStyle(SCORE_TABLE_STYLE)
 
     elements.append(table)
     elements.append(Spacer(1, 20))
@@ -99,10 +294,7 @@ def generate_pdf(report):
         ])
 
     test_table = Table(test_data, colWidths=[120, 120, 120, 80])
-    test_table.setStyle(TableStyle([
-        ("GRID", (0,0), (-1,-1), 1, colors.black),
-        ("BACKGROUND", (0,0), (-1,0), colors.lightgrey)
-    ]))
+    test_table.setStyle(TEST_TABLE_STYLE)
 
     elements.append(test_table)
     elements.append(Spacer(1, 16))
@@ -134,5 +326,86 @@ def generate_pdf(report):
     elements.append(Spacer(1, 30))
     elements.append(Paragraph("Generated by Professional C Autograder System", styles["Italic"]))
 
-    doc.build(elements)
+    return elements
+
+def _build_document(path, elements):
+    # Render next to the destination, then publish atomically
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".pdf.tmp", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        doc = SimpleDocTemplate(
+            tmp_path,
+            pagesize=A4,
+            rightMargin=40,
+            leftMargin=40,
+            topMargin=40,
+            bottomMargin=40
+        )
+        doc.build(elements)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
+
+def _evict_pdfs():
+    try:
+        pdfs = [os.path.join(PDF_CACHE_DIR, name) for name in os.listdir(PDF_CACHE_DIR) if name.endswith(".pdf")]
+        if len(pdfs) <= PDF_CACHE_MAX_FILES:
+            return
+        pdfs.sort(key=os.path.getmtime)
+        for path in pdfs[:len(pdfs) - PDF_CACHE_MAX_FILES]:
+            os.unlink(path)
+    except OSError:
+        pass  # another worker evicted concurrently
+
+def _render_pdf(path, report):
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    _build_document(path, _report_elements(report))
+    _evict_pdfs()
     return path
+
+@traced
+def generate_pdf(report):
+    return _render_pdf(pdf_path_for(report), report)
+
+# ---------------- BACKGROUND / BULK RENDERING ----------------
+_pdf_pool = None
+
+def _get_pdf_pool():
+    # Spawned (not forked) workers: the Streamlit server and batch driver are multi-threaded
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pdf_pool
+
+def generate_pdf_async(report):
+    # Returns a Future resolving to the PDF path; cached reports resolve immediately
+    path = pdf_path_for(report)
+    if os.path.exists(path):
+        future = Future()
+        future.set_result(path)
+        return future
+    # The path is resolved here so pool workers never depend on their own config
+    started = time.perf_counter()
+    future = _get_pdf_pool().submit(_render_pdf, path, report)
+    future.add_done_callback(lambda f: record(
+        "generate_pdf", time.perf_counter() - started, f.exception() and type(f.exception()).__name__))
+    return future
+
+def generate_pdfs_bulk(reports, merged_path=None):
+    # One PDF per report on the worker pool, or a single merged cohort PDF
+    if merged_path is None:
+        return list(_get_pdf_pool().map(_render_pdf, [pdf_path_for(r) for r in reports], reports))
+
+    elements = []
+    for i, report in enumerate(reports):
+        if i:
+            elements.append(PageBreak())
+        elements += _report_elements(report)
+    return _build_document(os.path.abspath(merged_path), elements)